@@ -0,0 +1,137 @@
+import datetime
+import gzip
+import json
+import os
+
+from invcache import cache_root, json_default, json_object_hook
+from pagecollect import PageStats, iter_pages
+
+# Force a full describe_alarms resync once the last one is older than this.
+DEFAULT_MAX_AGE = 24 * 3600
+# Re-read a little history before the watermark to cover late-arriving items.
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+# describe_alarms accepts at most 100 alarm names per call.
+NAMES_PER_CALL = 100
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _last_change(alarm):
+    return max(alarm.get("StateUpdatedTimestamp") or _EPOCH,
+               alarm.get("AlarmConfigurationUpdatedTimestamp") or _EPOCH)
+
+
+class AlarmStore:
+    """
+    Local copy of a region's metric alarms, keyed by alarm name.
+    A refresh either re-reads every alarm or, incrementally, only the alarms
+    that appear in the alarm history since the last run's watermark.
+    """
+
+    def __init__(self, profile_name, region):
+        self.profile_name = profile_name
+        self.region = region or "default"
+        self.alarms = {}
+        self.watermark = None
+        self.full_sync_at = None
+        self.mode = None
+        self.changed = 0
+
+    @property
+    def path(self):
+        return os.path.join(cache_root(), "alarms", self.profile_name, f"{self.region}.json.gz")
+
+    def load(self):
+        try:
+            with gzip.open(self.path, "rt") as f:
+                data = json.load(f, object_hook=json_object_hook)
+        except (OSError, ValueError):
+            return False
+        self.alarms = data["alarms"]
+        self.watermark = data["watermark"]
+        self.full_sync_at = data["full_sync_at"]
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt") as f:
+            json.dump({"watermark": self.watermark, "full_sync_at": self.full_sync_at, "alarms": self.alarms},
+                      f, default=json_default, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def full_sync(self, cw_client, stats):
+        started = _now()
+        alarms = {}
+        for page in iter_pages(cw_client, "describe_alarms", stats, PaginationConfig={"PageSize": 100}):
+            for alarm in page.get("MetricAlarms", []):
+                alarms[alarm["AlarmName"]] = alarm
+        self.alarms = alarms
+        self.watermark = started
+        self.full_sync_at = started
+        self.mode = "full"
+        self.changed = len(alarms)
+
+    def incremental_sync(self, cw_client, stats):
+        started = _now()
+        # Every alarm created, reconfigured, deleted or changing state since
+        # the watermark shows up in its history.
+        changed_names = set()
+        for page in iter_pages(cw_client, "describe_alarm_history", stats,
+                               StartDate=self.watermark - WATERMARK_OVERLAP, EndDate=started,
+                               PaginationConfig={"PageSize": 100}):
+            for item in page.get("AlarmHistoryItems", []):
+                if item.get("AlarmType", "MetricAlarm") == "MetricAlarm":
+                    changed_names.add(item["AlarmName"])
+
+        names = sorted(changed_names)
+        for i in range(0, len(names), NAMES_PER_CALL):
+            batch = names[i:i + NAMES_PER_CALL]
+            found = set()
+            for page in iter_pages(cw_client, "describe_alarms", stats, AlarmNames=batch):
+                for alarm in page.get("MetricAlarms", []):
+                    found.add(alarm["AlarmName"])
+                    stored = self.alarms.get(alarm["AlarmName"])
+                    # Keep whichever copy carries the newer state/configuration timestamp.
+                    if stored is None or _last_change(alarm) >= _last_change(stored):
+                        self.alarms[alarm["AlarmName"]] = alarm
+            # Alarms named in the history but no longer described were deleted.
+            for name in set(batch) - found:
+                self.alarms.pop(name, None)
+
+        self.watermark = started
+        self.mode = "incremental"
+        self.changed = len(names)
+
+    def refresh(self, cw_client, incremental=False, max_age=DEFAULT_MAX_AGE, stats=None):
+        """
+        Bring the store up to date and return the current list of alarms.
+        Incremental mode falls back to a full resync when the store is
+        missing or its last full sync is older than max_age seconds.
+        """
+        if stats is None:
+            stats = PageStats("alarms")
+        stale = True
+        if incremental and self.load():
+            stale = (_now() - self.full_sync_at).total_seconds() > max_age
+        if stale:
+            self.full_sync(cw_client, stats)
+        else:
+            self.incremental_sync(cw_client, stats)
+        self.save()
+        return list(self.alarms.values())
+
+    def print_stats(self):
+        print(f"Alarm store ({self.profile_name}/{self.region}): {self.mode} refresh, "
+              f"{self.changed} alarms re-read, {len(self.alarms)} alarms stored")
+
+
+def add_alarm_store_arguments(parser):
+    parser.add_argument("--incremental-alarms", action="store_true",
+                        help="refresh only alarms changed since the last run, using alarm history")
+    parser.add_argument("--alarm-store-max-age", type=int, default=DEFAULT_MAX_AGE,
+                        help=f"seconds before an incremental run forces a full alarm resync (default {DEFAULT_MAX_AGE})")
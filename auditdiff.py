@@ -0,0 +1,263 @@
+"""
+Drift diff between two runs of an audit.
+
+Both runs are read as streams, sorted by resource key (in memory for small
+inputs, otherwise in spilled chunks merged from disk) and walked together
+in one sort-merge pass, so memory stays bounded by the chunk size however
+large the inventories are. Records are reported as added, removed, or
+changed with one row per changed field.
+
+    python3 auditdiff.py last-week/ebs_snapshots.csv today/ebs_snapshots.csv
+    python3 auditdiff.py --sqlite audit.db --table ebs_snapshots RUN_A RUN_B
+
+CSV inputs may use either the classic layout (summary rows above the
+header, footers after a blank row) or the streaming one.
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import marshal
+import operator
+import os
+import sqlite3
+import sys
+import tempfile
+
+from streamcsv import batched
+
+# Rows sorted in memory at once; larger inputs are spilled in sorted chunks.
+CHUNK_ROWS = 100_000
+# Rows per marshal block in a spill file, so merging reads each chunk a block at a time.
+SPILL_BLOCK_ROWS = 4096
+
+# Columns identifying a record in each CSV, most specific first; the first
+# set fully present in a header is used, plus Region when there is one.
+CSV_KEYS = [
+    ("Security Group ID", "Instance ID", "Protocol", "From Port", "To Port", "CIDR"),  # security_audit.csv
+    ("Security Group ID", "Protocol", "From Port", "To Port", "CIDR"),  # sg_open_rules.csv
+    ("Security Group ID", "Instance ID"),  # sg_membership.csv
+    ("Resource Type", "Resource ID"),  # monitoring_audit.csv, ec2_orphans.csv
+    ("Snapshot ID",),
+    ("Volume ID",),
+    ("AMI ID",),
+    ("DB Instance Identifier",),
+    ("Bucket Name",),
+    ("Instance ID",),
+]
+
+# Record key per audit sink table; account and region are always added.
+SQLITE_KEYS = {
+    "ec2_instances": ("instance_id",),
+    "amis": ("ami_id",),
+    "ebs_volumes": ("volume_id",),
+    "ebs_snapshots": ("snapshot_id",),
+    "rds_instances": ("db_instance_identifier",),
+    "rds_snapshots": ("snapshot_id",),
+    "sg_open_rules": ("group_id", "protocol", "from_port", "to_port", "cidr"),
+    "sg_membership": ("group_id", "instance_id"),
+    "monitoring_resources": ("resource_type", "resource_id"),
+    "ec2_orphans": ("resource_type", "resource_id"),
+    "s3_buckets": ("bucket_name",),
+}
+
+# Derived from the run date, so they change every run without any drift.
+DEFAULT_IGNORE = ("Age", "Age (newest first)", "age")
+
+
+def read_csv(path):
+    """Return (header, row iterator) for an audit CSV, skipping summary rows and footers."""
+    f = open(path, newline="")
+    reader = csv.reader(f)
+    for header in reader:
+        # Summary rows ("Total ...: N") are single cells; the header is the first wider row.
+        if len(header) > 1:
+            break
+    else:
+        f.close()
+        return [], iter(())
+
+    def rows():
+        with f:
+            for row in reader:
+                if not any(row):
+                    return  # a blank row starts the footer
+                yield row
+    return header, rows()
+
+
+def read_sqlite(path, table, run_id):
+    """Return (header, rows ordered by key) for one run of an audit sink table."""
+    conn = sqlite3.connect(path)
+    columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})") if info[1] != "run_id"]
+    key = ["account", "region", *SQLITE_KEYS.get(table, ())]
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE run_id = ? "
+                          f"ORDER BY {', '.join(key)}", (run_id,))
+
+    def rows():
+        with conn:
+            for row in cursor:
+                yield tuple("" if value is None else str(value) for value in row)
+        conn.close()
+    return columns, rows()
+
+
+def key_columns(header):
+    for candidate in CSV_KEYS:
+        if all(column in header for column in candidate):
+            return [*candidate, "Region"] if "Region" in header else list(candidate)
+    raise ValueError(f"no known resource key in header {header}; pass --key")
+
+
+def external_sort(rows, key, tmpdir):
+    """Yield rows (tuples) sorted by key, spilling sorted chunks of CHUNK_ROWS to disk when needed."""
+    chunks = batched(rows, CHUNK_ROWS)
+    first = next(chunks, [])
+    first.sort(key=key)
+    second = next(chunks, None)
+    if second is None:
+        yield from first
+        return
+
+    spill_paths = []
+
+    def spill(chunk):
+        fd, path = tempfile.mkstemp(suffix=".spill", dir=tmpdir)
+        with os.fdopen(fd, "wb") as f:
+            for block in batched(chunk, SPILL_BLOCK_ROWS):
+                data = marshal.dumps(block)
+                f.write(len(data).to_bytes(8, "little"))
+                f.write(data)
+        spill_paths.append(path)
+
+    def replay(f):
+        # marshal.load reads a file in tiny pieces; whole length-prefixed blocks are much faster.
+        while True:
+            size = f.read(8)
+            if not size:
+                return
+            yield from marshal.loads(f.read(int.from_bytes(size, "little")))
+
+    spill(first)
+    second.sort(key=key)
+    spill(second)
+    for chunk in chunks:
+        chunk.sort(key=key)
+        spill(chunk)
+    files = [open(path, "rb") for path in spill_paths]
+    try:
+        yield from heapq.merge(*(replay(f) for f in files), key=key)
+    finally:
+        for f in files:
+            f.close()
+
+
+def diff_sorted(old_rows, new_rows, key):
+    """
+    Sort-merge two key-ordered row streams.
+    Yields (change, old row, new row) with change in added/removed/same/changed;
+    rows sharing a key are paired in order.
+    """
+    old_groups = itertools.groupby(old_rows, key)
+    new_groups = itertools.groupby(new_rows, key)
+    old_key, old_group = next(old_groups, (None, None))
+    new_key, new_group = next(new_groups, (None, None))
+    while old_group is not None or new_group is not None:
+        if new_group is None or (old_group is not None and old_key < new_key):
+            for row in old_group:
+                yield "removed", row, None
+            old_key, old_group = next(old_groups, (None, None))
+        elif old_group is None or new_key < old_key:
+            for row in new_group:
+                yield "added", None, row
+            new_key, new_group = next(new_groups, (None, None))
+        else:
+            for old_row, new_row in itertools.zip_longest(old_group, new_group):
+                if new_row is None:
+                    yield "removed", old_row, None
+                elif old_row is None:
+                    yield "added", None, new_row
+                else:
+                    yield ("same" if old_row == new_row else "changed"), old_row, new_row
+            old_key, old_group = next(old_groups, (None, None))
+            new_key, new_group = next(new_groups, (None, None))
+
+
+def diff_runs(old, new, output, keys=None, ignore=DEFAULT_IGNORE, presorted=False):
+    """
+    Diff two (header, rows) runs and write one CSV row per added/removed record
+    and per changed field. Returns the counts of each kind of change.
+    """
+    old_header, old_rows = old
+    new_header, new_rows = new
+    keys = keys or key_columns(new_header)
+    missing = [column for column in keys if column not in old_header or column not in new_header]
+    if missing:
+        raise ValueError(f"key column(s) {', '.join(missing)} missing from one of the runs")
+    # Only columns both runs have are compared.
+    compared = [column for column in new_header
+                if column in old_header and column not in keys and column not in ignore]
+
+    def projection(header):
+        # Rows become tuples of the key columns followed by the compared ones.
+        indexes = [header.index(column) for column in keys + compared]
+        if len(indexes) == 1:
+            return lambda row: (row[indexes[0]],)
+        return operator.itemgetter(*indexes)
+
+    old_project, new_project = projection(old_header), projection(new_header)
+    key_count = len(keys)
+    key = operator.itemgetter(*range(key_count))
+
+    counts = {"added": 0, "removed": 0, "changed": 0, "same": 0}
+    with tempfile.TemporaryDirectory(prefix="auditdiff-") as tmpdir, open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Change", *keys, "Field", "Old Value", "New Value"])
+        old_stream = map(old_project, old_rows)
+        new_stream = map(new_project, new_rows)
+        if not presorted:
+            old_stream = external_sort(old_stream, key, tmpdir)
+            new_stream = external_sort(new_stream, key, tmpdir)
+        for change, old_row, new_row in diff_sorted(old_stream, new_stream, key):
+            counts[change] += 1
+            if change == "added":
+                writer.writerow(["added", *new_row[:key_count], "", "", ""])
+            elif change == "removed":
+                writer.writerow(["removed", *old_row[:key_count], "", "", ""])
+            elif change == "changed":
+                for column, old_value, new_value in zip(compared, old_row[key_count:], new_row[key_count:]):
+                    if old_value != new_value:
+                        writer.writerow(["changed", *old_row[:key_count], column, old_value, new_value])
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report added, removed and changed records between two audit runs.")
+    parser.add_argument("old", help="older run: a CSV file, or a run id with --sqlite")
+    parser.add_argument("new", help="newer run: a CSV file, or a run id with --sqlite")
+    parser.add_argument("--sqlite", metavar="PATH", help="read both runs from this audit database")
+    parser.add_argument("--table", help=f"record type to diff with --sqlite ({', '.join(SQLITE_KEYS)})")
+    parser.add_argument("--key", action="append",
+                        help="key column, repeatable (default: inferred from the header)")
+    parser.add_argument("--ignore", action="append", default=list(DEFAULT_IGNORE),
+                        help="column to leave out of the comparison, repeatable (default: the age columns)")
+    parser.add_argument("--output", default="audit_drift.csv", help="where to write the drift report")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        if not args.table:
+            parser.error("--table is required with --sqlite")
+        old_run = read_sqlite(args.sqlite, args.table, args.old)
+        new_run = read_sqlite(args.sqlite, args.table, args.new)
+        keys = args.key or ["account", "region", *SQLITE_KEYS.get(args.table, ())]
+        # Rows arrive in key order unless a custom key was given.
+        presorted = not args.key
+    else:
+        old_run, new_run = read_csv(args.old), read_csv(args.new)
+        keys, presorted = args.key, False
+    try:
+        counts = diff_runs(old_run, new_run, args.output, keys, args.ignore, presorted)
+    except ValueError as e:
+        sys.exit(f"auditdiff: {e}")
+    print(f"{counts['added']} added, {counts['removed']} removed, {counts['changed']} changed, "
+          f"{counts['same']} unchanged. Drift report saved to {args.output}")
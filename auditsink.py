@@ -0,0 +1,128 @@
+"""
+Output sinks that receive each audit's records alongside its CSV files.
+
+open_sink() returns a NullSink unless a SQLite database was asked for, so
+audits can write to the sink unconditionally. SqliteSink keeps one table per
+record type. Every row carries the run id, account and region, and one
+`runs` row per audit run records when it ran and its summary counts:
+
+    SELECT s.snapshot_id, s.region, r.started_at
+    FROM ebs_snapshots s JOIN runs r USING (run_id)
+    WHERE s.account = '123456789012' AND s.created_by = 'N/A'
+    ORDER BY r.started_at DESC;
+"""
+import datetime
+import json
+import sqlite3
+import threading
+import uuid
+
+import awsclients
+
+RUNS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    audit TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    account TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    summary TEXT
+)
+"""
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+
+
+def _value(value):
+    """Store datetimes as ISO strings and lists as the comma-joined text the CSVs use."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return ", ".join(sorted(str(item) for item in value))
+    return value
+
+
+class NullSink:
+    """The sink used when no database is configured: every write is dropped."""
+
+    def write(self, record_type, rows, fields, key):
+        pass
+
+    def close(self, summary=None):
+        pass
+
+
+class SqliteSink:
+    """
+    Append one audit run to a SQLite database.
+    write() creates a record type's table and indexes on first use and
+    inserts all of its rows in a single transaction.
+    """
+
+    def __init__(self, path, audit, profile_name, account=None):
+        self.path = path
+        self.run_id = uuid.uuid4().hex
+        # Several audits may write to the same file from separate processes.
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.account = account
+        self._lock = threading.Lock()
+        self._tables = set()
+        with self.conn:
+            self.conn.execute(RUNS_SCHEMA)
+            self.conn.execute("INSERT INTO runs (run_id, audit, profile, account, started_at) VALUES (?, ?, ?, ?, ?)",
+                              (self.run_id, audit, profile_name, account, _utcnow()))
+
+    def _create_table(self, record_type, columns, key):
+        column_sql = ", ".join(f"{column} TEXT" if column != "region" else "region TEXT NOT NULL"
+                               for column in columns)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {record_type} "
+                          f"(run_id TEXT NOT NULL, account TEXT, {column_sql})")
+        # Databases written by older versions of an audit may lack newer columns.
+        existing = {info[1] for info in self.conn.execute(f"PRAGMA table_info({record_type})")}
+        for column in columns:
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE {record_type} ADD COLUMN {column} TEXT")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {record_type}_run "
+                          f"ON {record_type} (run_id, account, region)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {record_type}_{key} ON {record_type} ({key})")
+        self._tables.add(record_type)
+
+    def write(self, record_type, rows, fields, key):
+        """
+        Insert rows (dicts) into the record type's table.
+        fields maps column name -> row key and must include "region";
+        key is the resource id column to index.
+        """
+        columns = list(fields)
+        placeholders = ", ".join("?" * (len(columns) + 2))
+        values = ((self.run_id, self.account, *(_value(row.get(fields[column])) for column in columns))
+                  for row in rows)
+        with self._lock, self.conn:
+            if record_type not in self._tables:
+                self._create_table(record_type, columns, key)
+            self.conn.executemany(f"INSERT INTO {record_type} (run_id, account, {', '.join(columns)}) "
+                                  f"VALUES ({placeholders})", values)
+
+    def close(self, summary=None):
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE runs SET finished_at = ?, summary = ? WHERE run_id = ?",
+                              (_utcnow(), json.dumps(summary or {}), self.run_id))
+        self.conn.close()
+        print(f"Audit records saved to {self.path} (run {self.run_id})")
+
+
+def open_sink(profile_name, audit, sqlite_path=None):
+    """A SqliteSink for the run when a database path is given, otherwise a NullSink."""
+    if not sqlite_path:
+        return NullSink()
+    account = awsclients.get_client(profile_name, 'sts').get_caller_identity()['Account']
+    return SqliteSink(sqlite_path, audit, profile_name, account)
+
+
+def add_sink_arguments(parser):
+    parser.add_argument("--sqlite", metavar="PATH", default=None,
+                        help="also append this run's records to a SQLite database")
@@ -0,0 +1,130 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.utils import JSONFileCache
+
+import awsmetrics
+from invcache import cache_root
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, only the shared cache
+    fcntl = None
+
+# botocore's own default pool size; clients are never sized below it.
+DEFAULT_POOL_CONNECTIONS = 10
+# Attempts per call under adaptive retries, which also rate-limits client-side
+# once the service starts throttling.
+MAX_ATTEMPTS = 10
+
+# Credential providers that assume a role and accept a cache for the result.
+# botocore reuses a cached role session until it is within 15 minutes of
+# expiry, then assumes the role again ahead of time.
+ROLE_PROVIDERS = ("assume-role", "assume-role-with-web-identity")
+
+_sessions = {}
+_clients = {}
+# boto3 sessions are not thread-safe, so sessions and clients are created
+# under one lock; the clients themselves are safe to share between threads.
+_lock = threading.RLock()
+
+
+class ProfileCredentialCache(JSONFileCache):
+    """
+    The on-disk cache for one profile's assumed-role credentials. botocore
+    keys entries by the role's parameters; the profile name is added so
+    profiles sharing a role with different source credentials stay apart.
+    """
+
+    def __init__(self, profile_name):
+        super().__init__(credential_cache_dir())
+        self.profile_name = profile_name.replace(os.sep, "_").replace("/", "_")
+
+    def _convert_cache_key(self, cache_key):
+        return super()._convert_cache_key(f"{self.profile_name}--{cache_key}")
+
+
+def credential_cache_dir():
+    """Assumed-role credentials shared by every audit process, readable by the owner only."""
+    path = os.path.join(cache_root(), "credentials")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+def resolve_credentials(session, profile_name):
+    """
+    Resolve a session's credentials through the on-disk role cache, holding a
+    per-profile file lock so concurrent audits of one account make a single
+    AssumeRole call (and a single MFA prompt) between them.
+    """
+    providers = session._session.get_component("credential_provider")
+    for name in ROLE_PROVIDERS:
+        provider = providers.get_provider(name)
+        if provider is not None:
+            provider.cache = ProfileCredentialCache(profile_name)
+    if fcntl is None:
+        fetch_credentials(session)
+        return
+    lock_path = os.path.join(credential_cache_dir(), f"{ProfileCredentialCache(profile_name).profile_name}.lock")
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            fetch_credentials(session)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fetch_credentials(session):
+    # Assumed-role credentials are deferred until first use; use them now.
+    credentials = session.get_credentials()
+    if credentials is not None:
+        credentials.get_frozen_credentials()
+
+
+def get_session(profile_name):
+    """The process-wide, instrumented boto3 session for a profile."""
+    with _lock:
+        if profile_name not in _sessions:
+            session = boto3.Session(profile_name=profile_name)
+            awsmetrics.instrument(session)
+            resolve_credentials(session, profile_name)
+            _sessions[profile_name] = session
+        return _sessions[profile_name]
+
+
+def default_region(profile_name):
+    return get_session(profile_name).region_name
+
+
+def get_client(profile_name, service, region=None, concurrency=None):
+    """
+    A client cached per (profile, region, service).
+    Clients use adaptive retries and a connection pool of at least
+    `concurrency` connections; asking for more concurrency than a cached
+    client was built for replaces it with a larger one.
+    """
+    pool_size = max(concurrency or 0, DEFAULT_POOL_CONNECTIONS)
+    with _lock:
+        session = get_session(profile_name)
+        key = (profile_name, region or session.region_name, service)
+        cached = _clients.get(key)
+        if cached is None or cached[1] < pool_size:
+            config = Config(retries={'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS},
+                            max_pool_connections=pool_size)
+            cached = (session.client(service, region_name=key[1], config=config), pool_size)
+            _clients[key] = cached
+        return cached[0]
+
+
+def clear(profile_name=None):
+    """Forget the cached session and clients of one profile, or of every profile."""
+    with _lock:
+        if profile_name is None:
+            _clients.clear()
+            _sessions.clear()
+            return
+        for key in [key for key in _clients if key[0] == profile_name]:
+            _clients.pop(key)[0].close()
+        _sessions.pop(profile_name, None)
@@ -0,0 +1,179 @@
+"""
+Per-operation AWS API instrumentation for the audit scripts.
+
+instrument(session) hooks the botocore event system of a boto3 session so
+every API call made through its clients is recorded: call count, latency
+histogram, retries, throttles and response bytes per (service, operation).
+A summary table is printed when the process exits, or on demand with
+print_summary_and_reset().
+
+Environment:
+    AWS_AUDIT_METRICS=off           disable instrumentation entirely
+    AWS_AUDIT_METRICS_JSONL=<path>  also append one JSON line per API call
+"""
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+THROTTLE_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+    "TooManyRequestsException", "RequestLimitExceeded", "SlowDown", "RequestThrottled",
+    "ProvisionedThroughputExceededException", "BandwidthLimitExceeded", "LimitExceededException",
+}
+
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.bytes = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS_MS)
+
+    def observe(self, latency_ms):
+        self.calls += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency_ms <= bound:
+                self.histogram[i] += 1
+                break
+
+    def percentile(self, fraction):
+        """Histogram estimate: the upper bound of the bucket holding the given fraction of calls."""
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.histogram):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class Recorder:
+    def __init__(self, jsonl_path=None):
+        self.operations = {}
+        self.jsonl_path = jsonl_path
+        self._jsonl = None
+        self._lock = threading.Lock()
+
+    def _stats(self, context):
+        key = (context.get("awsmetrics_service", "?"), context.get("awsmetrics_operation", "?"))
+        if key not in self.operations:
+            self.operations[key] = OperationStats()
+        return self.operations[key]
+
+    def before_call(self, model, context, **kwargs):
+        context["awsmetrics_service"] = model.service_model.service_name
+        context["awsmetrics_operation"] = model.name
+        context["awsmetrics_start"] = time.perf_counter()
+
+    def after_call(self, http_response, parsed, context, **kwargs):
+        latency_ms = (time.perf_counter() - context.get("awsmetrics_start", time.perf_counter())) * 1000
+        error_code = parsed.get("Error", {}).get("Code") if http_response.status_code >= 300 else None
+        size = len(http_response.content or b"")
+        retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        with self._lock:
+            stats = self._stats(context)
+            stats.observe(latency_ms)
+            stats.bytes += size
+            stats.retries += retries
+            stats.errors += error_code is not None
+            self._write_line(context, latency_ms, size, retries, error_code)
+
+    def after_call_error(self, exception, context, **kwargs):
+        latency_ms = (time.perf_counter() - context.get("awsmetrics_start", time.perf_counter())) * 1000
+        with self._lock:
+            stats = self._stats(context)
+            stats.observe(latency_ms)
+            stats.errors += 1
+            self._write_line(context, latency_ms, 0, 0, type(exception).__name__)
+
+    def needs_retry(self, response=None, request_dict=None, **kwargs):
+        # Called once per HTTP attempt; count the attempts that were throttled.
+        if not response:
+            return None
+        code = response[1].get("Error", {}).get("Code")
+        if code in THROTTLE_CODES and request_dict is not None:
+            with self._lock:
+                self._stats(request_dict.get("context", {})).throttles += 1
+        return None
+
+    def _write_line(self, context, latency_ms, size, retries, error_code):
+        if not self.jsonl_path:
+            return
+        if self._jsonl is None:
+            self._jsonl = open(self.jsonl_path, "a")
+        self._jsonl.write(json.dumps({
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "pid": os.getpid(),
+            "service": context.get("awsmetrics_service"),
+            "operation": context.get("awsmetrics_operation"),
+            "latency_ms": round(latency_ms, 2),
+            "bytes": size,
+            "retries": retries,
+            "error": error_code,
+        }) + "\n")
+
+    def print_summary(self):
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+        if not self.operations:
+            return
+        print("\nAWS API summary:")
+        print(f"  {'Service':<12} {'Operation':<36} {'Calls':>7} {'Errors':>6} {'Retries':>7} {'Throttles':>9} "
+              f"{'Mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'Max ms':>8} {'Bytes':>13}")
+        for (service, operation), s in sorted(self.operations.items(), key=lambda item: -item[1].calls):
+            print(f"  {service:<12} {operation:<36} {s.calls:>7} {s.errors:>6} {s.retries:>7} {s.throttles:>9} "
+                  f"{s.total_ms / s.calls:>8.1f} {s.percentile(0.5):>7.0f} {s.percentile(0.95):>7.0f} "
+                  f"{s.max_ms:>8.1f} {s.bytes:>13,}")
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def recorder():
+    """The process-wide Recorder, created (and its exit summary registered) on first use."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = Recorder(os.environ.get("AWS_AUDIT_METRICS_JSONL"))
+            atexit.register(_recorder.print_summary)
+        return _recorder
+
+
+def print_summary_and_reset():
+    """Print the calls recorded so far and start counting afresh, for processes running several audits."""
+    with _recorder_lock:
+        rec = _recorder
+    if rec is None:
+        return
+    with rec._lock:
+        rec.print_summary()
+        rec.operations = {}
+
+
+def instrument(session):
+    """Record every API call made by clients created from this boto3 session from now on."""
+    if os.environ.get("AWS_AUDIT_METRICS", "").lower() == "off":
+        return session
+    rec = recorder()
+    events = session.events
+    # before-parameter-build fires for every call, even ones answered by an
+    # earlier before-call handler, so the start time is taken there.
+    events.register("before-parameter-build", rec.before_call, unique_id="awsmetrics-before")
+    events.register("after-call", rec.after_call, unique_id="awsmetrics-after")
+    events.register("after-call-error", rec.after_call_error, unique_id="awsmetrics-after-error")
+    events.register("needs-retry", rec.needs_retry, unique_id="awsmetrics-needs-retry")
+    return session
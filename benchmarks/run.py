@@ -0,0 +1,174 @@
+"""
+Synthetic large-account benchmarks for the audit scripts.
+
+Every (audit, account size) pair runs in a fresh interpreter against the
+in-process stand-in in fakeaws.py. Each run records wall time, API calls
+and peak RSS, and all results go to one JSON file that can be compared
+between commits:
+
+    python3 benchmarks/run.py --sizes 1000,10000 --output before.json
+    python3 benchmarks/run.py --sizes 1000,10000 --output after.json
+    python3 benchmarks/run.py --compare before.json after.json
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+PROFILE_NAME = "bench"
+
+# audit name -> (module, entry point taking the profile name[, keyword arguments])
+AUDITS = {
+    "ec2auditfull": ("ec2auditfull", "audit_ec2_resources"),
+    "ec2auditfull-stream": ("ec2auditfull", "audit_ec2_resources", {"stream": True}),
+    "ec2auditfull-config": ("ec2auditfull", "audit_ec2_resources", {"backend": "config"}),
+    "ec2auditfull-utilization": ("ec2auditfull", "audit_ec2_resources", {"utilization": True}),
+    "ec2auditfull-stream-utilization": ("ec2auditfull", "audit_ec2_resources",
+                                        {"stream": True, "utilization": True}),
+    "ec2auditfull-snapshot-sizes": ("ec2auditfull", "audit_ec2_resources", {"snapshot_sizes": True}),
+    "rdsaudit": ("rdsaudit", "audit_rds_resources"),
+    "rdsaudit-stream": ("rdsaudit", "audit_rds_resources", {"stream": True}),
+    "sgaudit": ("sgaudit", "audit_security_groups"),
+    "sgaudit-server-filter": ("sgaudit", "audit_security_groups", {"server_filter": True}),
+    "sgaudit-config": ("sgaudit", "audit_security_groups", {"backend": "config"}),
+    "cwaudit": ("cwaudit", "audit_monitoring_resources"),
+    "s3audit": ("s3audit", "audit_s3_buckets"),
+    "s3audit-stream": ("s3audit", "audit_s3_buckets", {"stream": True}),
+    "s3audit-config": ("s3audit", "audit_s3_buckets", {"backend": "config"}),
+    "ebssnapshotfinder": ("ebssnapshotfinder", "fetch_snapshots_by_profile"),
+    "ebssnapshotfindernum": ("ebssnapshotfindernum", "fetch_snapshot_counts"),
+}
+
+DEFAULT_SIZES = "1000,10000,100000"
+
+
+def run_child(audit, size, latency, result_path):
+    """Run one audit against a synthetic account and write its measurements."""
+    workdir = tempfile.mkdtemp(prefix=f"bench-{audit}-{size}-")
+    config_path = os.path.join(workdir, "aws_config")
+    with open(config_path, "w") as f:
+        f.write(f"[profile {PROFILE_NAME}]\nregion = us-east-1\n"
+                "aws_access_key_id = AKIABENCHMARK\naws_secret_access_key = benchmark\n")
+    os.environ["AWS_CONFIG_FILE"] = config_path
+    os.environ["AWS_SHARED_CREDENTIALS_FILE"] = os.path.join(workdir, "no_credentials")
+    # A private cache directory, so every run starts cold.
+    os.environ["AWS_AUDIT_CACHE_DIR"] = os.path.join(workdir, "cache")
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    os.chdir(workdir)
+
+    import fakeaws
+    account = fakeaws.SyntheticAccount(size, latency=latency)
+    account.install()
+    module_name, function_name, *options = AUDITS[audit]
+    audit_function = getattr(importlib.import_module(module_name), function_name)
+
+    start = time.perf_counter()
+    audit_function(PROFILE_NAME, **(options[0] if options else {}))
+    wall = time.perf_counter() - start
+
+    with open(result_path, "w") as f:
+        json.dump({
+            "audit": audit,
+            "size": size,
+            "wall_seconds": round(wall, 4),
+            "api_calls": sum(account.calls.values()),
+            "api_calls_by_operation": dict(sorted(account.calls.items())),
+            # ru_maxrss is in KiB on Linux and in bytes on macOS.
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+        }, f)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(audits, sizes, latency, output):
+    results = []
+    print(f"{'Audit':<22} {'Size':>8} {'Wall (s)':>10} {'API calls':>10} {'Peak RSS (MiB)':>15}")
+    for audit in audits:
+        for size in sizes:
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                result_path = f.name
+            try:
+                status = subprocess.call([sys.executable, os.path.abspath(__file__), "--child", audit, str(size),
+                                          "--latency-ms", str(latency * 1000), "--result", result_path],
+                                         stdout=subprocess.DEVNULL)
+                if status != 0:
+                    print(f"{audit:<22} {size:>8} FAILED (exit {status})")
+                    results.append({"audit": audit, "size": size, "error": f"exit {status}"})
+                    continue
+                with open(result_path) as f:
+                    result = json.load(f)
+            finally:
+                os.remove(result_path)
+            results.append(result)
+            print(f"{audit:<22} {size:>8} {result['wall_seconds']:>10.2f} {result['api_calls']:>10} "
+                  f"{result['peak_rss_kb'] / 1024:>15.1f}")
+
+    with open(output, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "latency_ms": latency * 1000,
+            "results": results,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+def compare(before_path, after_path):
+    """Print per-(audit, size) ratios between two result files."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    old = {(r["audit"], r["size"]): r for r in before["results"] if "error" not in r}
+    print(f"Comparing {before.get('commit') or before_path} -> {after.get('commit') or after_path}")
+    print(f"{'Audit':<22} {'Size':>8} {'Wall':>16} {'API calls':>16} {'Peak RSS (MiB)':>18}")
+    for r in after["results"]:
+        base = old.get((r["audit"], r["size"]))
+        if base is None or "error" in r:
+            continue
+        print(f"{r['audit']:<22} {r['size']:>8} "
+              f"{base['wall_seconds']:>7.2f}->{r['wall_seconds']:<7.2f} "
+              f"{base['api_calls']:>7}->{r['api_calls']:<7} "
+              f"{base['peak_rss_kb'] / 1024:>8.1f}->{r['peak_rss_kb'] / 1024:<8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the audit scripts against synthetic accounts.")
+    parser.add_argument("--audits", default="all", help=f"comma-separated audits (default: all of {', '.join(AUDITS)})")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated account sizes (default {DEFAULT_SIZES})")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="simulated round-trip time per API call, in milliseconds (default 0)")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the results")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    parser.add_argument("--child", nargs=2, metavar=("AUDIT", "SIZE"), help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.child:
+        run_child(args.child[0], int(args.child[1]), args.latency_ms / 1000, args.result)
+    else:
+        audits = list(AUDITS) if args.audits == "all" else [a.strip() for a in args.audits.split(",")]
+        unknown = [a for a in audits if a not in AUDITS]
+        if unknown:
+            parser.error(f"unknown audit(s): {', '.join(unknown)}")
+        sizes = [int(size) for size in args.sizes.split(",")]
+        run_suite(audits, sizes, args.latency_ms / 1000, args.output)
@@ -0,0 +1,181 @@
+"""
+AWS Config advanced queries as a bulk alternative to the describe APIs.
+
+ConfigBackend has the same pages() interface as InventoryCache, so the
+audits' collectors run unchanged on top of it. For the resource types AWS
+Config records, one paginated select_resource_config query (or
+select_aggregate_resource_config, with an aggregator) replaces the describe
+calls and its results are reshaped into describe pages. Everything else,
+and any type Config returns nothing for, falls back to the live describe
+API through the wrapped inventory cache.
+
+S3 bucket settings come from the buckets' supplementaryConfiguration, so
+s3audit needs one query instead of three calls per bucket.
+"""
+import json
+import threading
+
+import awsclients
+from pagecollect import PageStats
+
+DEFAULT_BACKEND = "describe"
+
+# select_resource_config returns at most 100 results per page.
+QUERY_PAGE_SIZE = 100
+
+# describe operation -> (Config resource type, result list key).
+CONFIG_TYPES = {
+    "describe_instances": ("AWS::EC2::Instance", "Instances"),
+    "describe_volumes": ("AWS::EC2::Volume", "Volumes"),
+    "describe_security_groups": ("AWS::EC2::SecurityGroup", "SecurityGroups"),
+}
+
+
+# Profile -> account id, so aggregator backends for every region share one STS call.
+_accounts = {}
+_accounts_lock = threading.Lock()
+
+
+def caller_account(profile_name):
+    with _accounts_lock:
+        if profile_name not in _accounts:
+            _accounts[profile_name] = awsclients.get_client(profile_name, 'sts').get_caller_identity()['Account']
+        return _accounts[profile_name]
+
+
+def pascal(value):
+    """Config reports describe shapes with camelCase keys; restore the API's PascalCase."""
+    if isinstance(value, dict):
+        return {key[:1].upper() + key[1:]: pascal(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [pascal(item) for item in value]
+    return value
+
+
+def describe_shape(resource_type, configuration):
+    item = pascal(configuration)
+    if resource_type == "AWS::EC2::SecurityGroup":
+        # Config lists IPv4 sources twice: bare CIDRs in ipRanges and full ranges in ipv4Ranges.
+        for permissions in ("IpPermissions", "IpPermissionsEgress"):
+            for permission in item.get(permissions, []):
+                permission["IpRanges"] = permission.pop("Ipv4Ranges", [])
+    return item
+
+
+def supplementary(value):
+    # Supplementary configuration items may arrive as JSON text.
+    return json.loads(value) if isinstance(value, str) else (value or {})
+
+
+class ConfigBackend:
+    """
+    Serve describe pages from AWS Config where it has data, and from the
+    fallback (an InventoryCache) otherwise. Config queries themselves go
+    through the fallback cache, so repeated audits replay them too.
+    """
+
+    def __init__(self, config_client, fallback, region, aggregator=None, account=None):
+        self.config_client = config_client
+        self.fallback = fallback
+        self.region = region
+        self.aggregator = aggregator
+        self.account = account
+        self.served = {}
+        self.fell_back = set()
+
+    def query(self, select, where, stats=None):
+        """Yield the result items of one advanced query, restricted to this backend's region (and account)."""
+        expression = f"SELECT {select} WHERE {where} AND awsRegion = '{self.region}'"
+        if self.aggregator:
+            # An aggregator usually spans many accounts; only the audited one belongs in the report.
+            expression += f" AND accountId = '{self.account}'"
+            pages = self.fallback.pages(self.config_client, 'select_aggregate_resource_config', stats,
+                                        Expression=expression, ConfigurationAggregatorName=self.aggregator,
+                                        PaginationConfig={'PageSize': QUERY_PAGE_SIZE})
+        else:
+            pages = self.fallback.pages(self.config_client, 'select_resource_config', stats,
+                                        Expression=expression, PaginationConfig={'PageSize': QUERY_PAGE_SIZE})
+        for page in pages:
+            for result in page.get('Results', []):
+                yield json.loads(result)
+
+    def pages(self, client, operation, stats=None, **kwargs):
+        """Yield describe-shaped pages for an operation, from Config when possible."""
+        # Filtered or owner-scoped describes have no Config equivalent here.
+        params = {k: v for k, v in kwargs.items() if k != "PaginationConfig"}
+        if operation not in CONFIG_TYPES or params:
+            yield from self.fallback.pages(client, operation, stats, **kwargs)
+            return
+        if stats is None:
+            stats = PageStats(operation)
+        resource_type, result_key = CONFIG_TYPES[operation]
+        batch = []
+        served = 0
+        for result in self.query("configuration", f"resourceType = '{resource_type}'", stats):
+            batch.append(describe_shape(resource_type, result.get("configuration", {})))
+            if len(batch) == 1000:
+                served += len(batch)
+                yield self._page(operation, result_key, batch)
+                batch = []
+        served += len(batch)
+        if served == 0:
+            # Config has nothing for this type here, perhaps because it is not recorded.
+            self.fell_back.add(operation)
+            yield from self.fallback.pages(client, operation, stats, **kwargs)
+            return
+        if batch:
+            yield self._page(operation, result_key, batch)
+        self.served[operation] = served
+
+    @staticmethod
+    def _page(operation, result_key, items):
+        if operation == "describe_instances":
+            return {"Reservations": [{"Instances": items}]}
+        return {result_key: items}
+
+    def bucket_settings(self, stats=None):
+        """
+        {bucket name: (versioning, logging, lifecycle rules)} for every bucket
+        Config records in this region. Versioning and logging use s3audit's
+        probe vocabulary; rules are shaped like GetBucketLifecycleConfiguration's.
+        """
+        settings = {}
+        select = ("resourceName, supplementaryConfiguration.BucketVersioningConfiguration, "
+                  "supplementaryConfiguration.BucketLoggingConfiguration, "
+                  "supplementaryConfiguration.BucketLifecycleConfiguration")
+        for result in self.query(select, "resourceType = 'AWS::S3::Bucket'", stats):
+            extra = result.get("supplementaryConfiguration", {})
+            versioning = supplementary(extra.get("BucketVersioningConfiguration")).get("status", "Off")
+            logging = supplementary(extra.get("BucketLoggingConfiguration"))
+            rules = supplementary(extra.get("BucketLifecycleConfiguration")).get("rules", [])
+            settings[result["resourceName"]] = (
+                "Disabled" if versioning == "Off" else versioning,
+                "Enabled" if logging.get("destinationBucketName") else "Disabled",
+                [{"ID": rule.get("id", "Unnamed"), "Status": rule.get("status", "Disabled")} for rule in rules],
+            )
+        self.served["bucket_settings"] = len(settings)
+        return settings
+
+    def print_stats(self):
+        served = ", ".join(f"{operation}: {count}" for operation, count in self.served.items()) or "nothing"
+        print(f"AWS Config ({self.region}): served {served}"
+              + (f"; fell back to describe for {', '.join(sorted(self.fell_back))}" if self.fell_back else ""))
+        self.fallback.print_stats()
+
+
+def open_backend(profile_name, region, cache, backend=DEFAULT_BACKEND, aggregator=None):
+    """The collector source for one region: the inventory cache itself, or Config in front of it."""
+    if backend != "config":
+        return cache
+    # Aggregator queries are answered by the aggregator's home (the profile's default) region.
+    config_client = awsclients.get_client(profile_name, 'config', None if aggregator else region)
+    account = caller_account(profile_name) if aggregator else None
+    return ConfigBackend(config_client, cache, region, aggregator, account)
+
+
+def add_backend_arguments(parser):
+    parser.add_argument("--backend", choices=("describe", "config"), default=DEFAULT_BACKEND,
+                        help="where inventory comes from: the describe APIs (default), or AWS Config "
+                             "advanced queries with per-type fallback to describe")
+    parser.add_argument("--config-aggregator", metavar="NAME", default=None,
+                        help="query this Config aggregator instead of the account's own recorder")
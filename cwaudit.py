@@ -1,157 +1,178 @@
-import boto3
+import argparse
 import botocore
 import csv
 import sys
 
+import alarmstore
+import auditsink
+import invcache
+from pagecollect import collect_families
+from regionfanout import add_region_arguments, fan_out, print_region_timings, regional_clients, resolve_regions
+
 def extract_trailing_id(value):
     """Splits a string by '/' and returns the last element."""
     return value.split("/")[-1] if "/" in value else value
 
-def audit_monitoring_resources(profile_name):
-    session = boto3.Session(profile_name=profile_name)
-
-    # Clients for EC2, RDS, ELBv2, and CloudWatch.
-    ec2_client   = session.client('ec2')
-    rds_client   = session.client('rds')
-    elbv2_client = session.client('elbv2')
-    cw_client    = session.client('cloudwatch')
-
-    # -------------------------------------------------------------------------
-    # 1. Collect Resources
-    # -------------------------------------------------------------------------
-    # EC2 Instances.
-    ec2_response = ec2_client.describe_instances()
+# Alarm dimension that identifies each resource type, and how to derive the
+# dimension value from the resource ID.
+RESOURCE_DIMENSIONS = {
+    "EC2 Instance": ("InstanceId", lambda resource_id: resource_id),
+    "RDS Instance": ("DBInstanceIdentifier", lambda resource_id: resource_id),
+    # For load balancers and target groups, extract the trailing id from the ARN.
+    "Load Balancer": ("LoadBalancer", extract_trailing_id),
+    "Target Group": ("TargetGroup", extract_trailing_id),
+}
+
+def make_resource(resource_type, resource_id, resource_name):
+    dimension, parse = RESOURCE_DIMENSIONS[resource_type]
+    return {
+        "ResourceType": resource_type,
+        "ResourceId": resource_id,
+        "ResourceName": resource_name,
+        "AlarmKey": (dimension, parse(resource_id)),
+        "Alarms": []  # To be populated later.
+    }
+
+def collect_ec2_instances(ec2_client, cache, stats):
     ec2_resources = []
-    for reservation in ec2_response.get("Reservations", []):
-        for instance in reservation.get("Instances", []):
-            instance_id   = instance.get("InstanceId", "N/A")
-            instance_name = "N/A"
-            for tag in instance.get("Tags", []):
-                if tag.get("Key") == "Name":
-                    instance_name = tag.get("Value")
-                    break
-            ec2_resources.append({
-                "ResourceType": "EC2 Instance",
-                "ResourceId": instance_id,
-                "ResourceName": instance_name,
-                "Alarms": []  # To be populated later.
-            })
-
-    # RDS Instances.
-    rds_response = rds_client.describe_db_instances()
+    for page in cache.pages(ec2_client, "describe_instances", stats, PaginationConfig={"PageSize": 1000}):
+        for reservation in page.get("Reservations", []):
+            for instance in reservation.get("Instances", []):
+                instance_id   = instance.get("InstanceId", "N/A")
+                instance_name = "N/A"
+                for tag in instance.get("Tags", []):
+                    if tag.get("Key") == "Name":
+                        instance_name = tag.get("Value")
+                        break
+                ec2_resources.append(make_resource("EC2 Instance", instance_id, instance_name))
+    return ec2_resources
+
+def collect_rds_instances(rds_client, cache, stats):
     rds_resources = []
-    for db in rds_response.get("DBInstances", []):
-        db_id = db.get("DBInstanceIdentifier", "N/A")
-        rds_resources.append({
-            "ResourceType": "RDS Instance",
-            "ResourceId": db_id,
-            "ResourceName": db_id,
-            "Alarms": []
-        })
-
-    # Load Balancers.
-    lb_response = elbv2_client.describe_load_balancers()
+    for page in cache.pages(rds_client, "describe_db_instances", stats):
+        for db in page.get("DBInstances", []):
+            db_id = db.get("DBInstanceIdentifier", "N/A")
+            rds_resources.append(make_resource("RDS Instance", db_id, db_id))
+    return rds_resources
+
+def collect_load_balancers(elbv2_client, cache, stats):
     lb_resources = []
-    for lb in lb_response.get("LoadBalancers", []):
-        lb_arn  = lb.get("LoadBalancerArn", "N/A")
-        lb_name = lb.get("LoadBalancerName", "N/A")
-        lb_resources.append({
-            "ResourceType": "Load Balancer",
-            "ResourceId": lb_arn,
-            "ResourceName": lb_name,  # Use LB name from console.
-            "Alarms": []
-        })
-
-    # Target Groups.
-    tg_response = elbv2_client.describe_target_groups()
+    for page in cache.pages(elbv2_client, "describe_load_balancers", stats, PaginationConfig={"PageSize": 400}):
+        for lb in page.get("LoadBalancers", []):
+            lb_arn  = lb.get("LoadBalancerArn", "N/A")
+            lb_name = lb.get("LoadBalancerName", "N/A")  # Use LB name from console.
+            lb_resources.append(make_resource("Load Balancer", lb_arn, lb_name))
+    return lb_resources
+
+def collect_target_groups(elbv2_client, cache, stats):
     tg_resources = []
-    for tg in tg_response.get("TargetGroups", []):
-        tg_arn  = tg.get("TargetGroupArn", "N/A")
-        tg_name = tg.get("TargetGroupName", "N/A")
-        tg_resources.append({
-            "ResourceType": "Target Group",
-            "ResourceId": tg_arn,
-            "ResourceName": tg_name,  # Use TG name from console.
-            "Alarms": []
-        })
+    for page in cache.pages(elbv2_client, "describe_target_groups", stats, PaginationConfig={"PageSize": 400}):
+        for tg in page.get("TargetGroups", []):
+            tg_arn  = tg.get("TargetGroupArn", "N/A")
+            tg_name = tg.get("TargetGroupName", "N/A")  # Use TG name from console.
+            tg_resources.append(make_resource("Target Group", tg_arn, tg_name))
+    return tg_resources
+
+def collect_alarms(cw_client, alarm_store, incremental, max_age, stats):
+    # Alarm states change constantly, so alarms bypass the inventory cache and
+    # are kept current in the alarm store instead.
+    return alarm_store.refresh(cw_client, incremental, max_age, stats)
+
+def build_alarm_index(alarm_data):
+    """
+    Map (dimension name, parsed dimension value) -> set of "name (state)"
+    strings, in one pass over the alarms.
+    """
+    allowed_keys = {dimension for dimension, _ in RESOURCE_DIMENSIONS.values()}
+    alarm_index = {}
+    for alarm in alarm_data:
+        alarm_repr = f"{alarm.get('AlarmName', 'N/A')} ({alarm.get('StateValue', 'N/A')})"
+        for dim in alarm.get("Dimensions", []):
+            dim_name = dim.get("Name", "")
+            if dim_name not in allowed_keys:
+                continue
+            # For any alarm with dimension "LoadBalancer" or "TargetGroup", always extract the trailing ID.
+            if dim_name in ("LoadBalancer", "TargetGroup"):
+                parsed_value = extract_trailing_id(dim.get("Value", ""))
+            else:
+                parsed_value = dim.get("Value", "")
+            alarm_index.setdefault((dim_name, parsed_value), set()).add(alarm_repr)
+    return alarm_index
+
+def audit_region(clients, cache, alarm_store, region, incremental_alarms=False,
+                 alarm_store_max_age=alarmstore.DEFAULT_MAX_AGE):
+    """
+    Collect resources and alarms in one region and join them.
+    Returns (resources, (INSUFFICIENT_DATA, OK, ALARM alarm counts)).
+    """
+    ec2_client   = clients["ec2"][region]
+    rds_client   = clients["rds"][region]
+    elbv2_client = clients["elbv2"][region]
+    cw_client    = clients["cloudwatch"][region]
+
+    # -------------------------------------------------------------------------
+    # 1. Collect resources and CloudWatch alarms concurrently, so the phase
+    #    takes as long as the slowest API rather than the sum of all of them.
+    # -------------------------------------------------------------------------
+    results, _ = collect_families({
+        "ec2": lambda stats: collect_ec2_instances(ec2_client, cache, stats),
+        "rds": lambda stats: collect_rds_instances(rds_client, cache, stats),
+        "elb": lambda stats: collect_load_balancers(elbv2_client, cache, stats),
+        "tg": lambda stats: collect_target_groups(elbv2_client, cache, stats),
+        "alarms": lambda stats: collect_alarms(cw_client, alarm_store, incremental_alarms,
+                                               alarm_store_max_age, stats),
+    })
 
     # Combine all resources.
-    all_resources = ec2_resources + rds_resources + lb_resources + tg_resources
+    all_resources = results["ec2"] + results["rds"] + results["elb"] + results["tg"]
+    alarm_data = results["alarms"]
 
     # -------------------------------------------------------------------------
-    # 2. Retrieve CloudWatch Alarms and build a mapping from dimension keys
-    #    to alarm names with their current state.
+    # 2. Count alarms by state and index them by (dimension, parsed id).
     # -------------------------------------------------------------------------
-    alarm_data = []
-    next_token = None
-    while True:
-        if next_token:
-            resp = cw_client.describe_alarms(NextToken=next_token)
-        else:
-            resp = cw_client.describe_alarms()
-        alarm_data.extend(resp.get("MetricAlarms", []))
-        next_token = resp.get("NextToken")
-        if not next_token:
-            break
-
-    # Compute counts of alarms by state.
     insufficient_count = sum(1 for alarm in alarm_data if alarm.get("StateValue") == "INSUFFICIENT_DATA")
     ok_count           = sum(1 for alarm in alarm_data if alarm.get("StateValue") == "OK")
     in_alarm_count     = sum(1 for alarm in alarm_data if alarm.get("StateValue") == "ALARM")
 
-    # Calculate Total Alarms Configured as the sum of all three state counts.
-    total_alarms_configured = insufficient_count + ok_count + in_alarm_count
-
-    # Allowed keys for mapping.
-    allowed_keys = ["InstanceId", "DBInstanceIdentifier", "LoadBalancer", "TargetGroup"]
-    # Create nested mapping: for each allowed key, map a (parsed) dimension value -> set(alarm representations)
-    alarm_mapping = { key: {} for key in allowed_keys }
-
-    for alarm in alarm_data:
-        alarm_name = alarm.get("AlarmName", "N/A")
-        state      = alarm.get("StateValue", "N/A")
-        alarm_repr = f"{alarm_name} ({state})"
-        namespace  = alarm.get("Namespace", "")
-        
-        for dim in alarm.get("Dimensions", []):
-            dim_name  = dim.get("Name", "")
-            dim_value = dim.get("Value", "")
-            if dim_name not in allowed_keys:
-                continue
-            # For any alarm with dimension "LoadBalancer" or "TargetGroup", always extract the trailing ID.
-            if dim_name in ["LoadBalancer", "TargetGroup"]:
-                parsed_value = extract_trailing_id(dim_value)
-            else:
-                parsed_value = dim_value
-
-            if parsed_value not in alarm_mapping[dim_name]:
-                alarm_mapping[dim_name][parsed_value] = set()
-            alarm_mapping[dim_name][parsed_value].add(alarm_repr)
+    alarm_index = build_alarm_index(alarm_data)
 
     # -------------------------------------------------------------------------
-    # 3. Associate alarms with the collected resources.
+    # 3. Associate alarms with the collected resources: one lookup each.
     # -------------------------------------------------------------------------
     for resource in all_resources:
-        rtype = resource["ResourceType"]
-        alarms_set = set()
-        if rtype == "EC2 Instance":
-            alarms_set = alarms_set.union(alarm_mapping["InstanceId"].get(resource["ResourceId"], set()))
-        elif rtype == "RDS Instance":
-            alarms_set = alarms_set.union(alarm_mapping["DBInstanceIdentifier"].get(resource["ResourceId"], set()))
-        elif rtype == "Load Balancer":
-            # For load balancer, extract trailing id from its ARN.
-            lb_id = extract_trailing_id(resource["ResourceId"])
-            alarms_set = alarms_set.union(alarm_mapping["LoadBalancer"].get(lb_id, set()))
-        elif rtype == "Target Group":
-            # For target groups, extract trailing id from its ARN.
-            tg_id = extract_trailing_id(resource["ResourceId"])
-            alarms_set = alarms_set.union(alarm_mapping["TargetGroup"].get(tg_id, set()))
-        
-        if not alarms_set:
-            resource["Alarms"] = ["No monitoring configured"]
-        else:
-            resource["Alarms"] = list(alarms_set)
+        alarms_set = alarm_index.get(resource["AlarmKey"])
+        resource["Alarms"] = list(alarms_set) if alarms_set else ["No monitoring configured"]
+        resource["Region"] = region
+
+    return all_resources, (insufficient_count, ok_count, in_alarm_count)
+
+# Columns of the monitoring_resources record type in the audit sink.
+SINK_FIELDS = {"resource_type": "ResourceType", "resource_id": "ResourceId", "resource_name": "ResourceName",
+               "alarms": "Alarms", "region": "Region"}
+
+def audit_monitoring_resources(profile_name, regions=None, cache_ttl=invcache.DEFAULT_TTL, refresh_cache=False,
+                               incremental_alarms=False, alarm_store_max_age=alarmstore.DEFAULT_MAX_AGE,
+                               sqlite_path=None):
+    sink = auditsink.open_sink(profile_name, "cwaudit", sqlite_path)
+    region_names = resolve_regions(profile_name, regions)
+    caches = {region: invcache.open_cache(profile_name, region, cache_ttl, refresh_cache) for region in region_names}
+    alarm_stores = {region: alarmstore.AlarmStore(profile_name, region) for region in region_names}
 
+    # Clients for EC2, RDS, ELBv2, and CloudWatch in every audited region.
+    clients = {service: regional_clients(profile_name, service, region_names)
+               for service in ("ec2", "rds", "elbv2", "cloudwatch")}
+
+    region_results, region_timings = fan_out(
+        region_names, lambda region: audit_region(clients, caches[region], alarm_stores[region], region,
+                                                  incremental_alarms, alarm_store_max_age))
+
+    all_resources = [resource for resources, _ in region_results.values() for resource in resources]
+    insufficient_count = sum(counts[0] for _, counts in region_results.values())
+    ok_count           = sum(counts[1] for _, counts in region_results.values())
+    in_alarm_count     = sum(counts[2] for _, counts in region_results.values())
+
+    # Calculate Total Alarms Configured as the sum of all three state counts.
+    total_alarms_configured = insufficient_count + ok_count + in_alarm_count
     total_resources = len(all_resources)
 
     # -------------------------------------------------------------------------
@@ -166,20 +187,36 @@ def audit_monitoring_resources(profile_name):
         writer.writerow([f"Total OK Alarms: {ok_count}"])
         writer.writerow([f"Total ALARM Alarms: {in_alarm_count}"])
         # Write CSV header.
-        writer.writerow(["Resource Type", "Resource ID", "Resource Name", "Alarms Configured"])
+        writer.writerow(["Resource Type", "Resource ID", "Resource Name", "Alarms Configured", "Region"])
         for resource in all_resources:
             alarms_configured = ", ".join(sorted(resource["Alarms"]))
-            writer.writerow([resource["ResourceType"], resource["ResourceId"], resource["ResourceName"], alarms_configured])
+            writer.writerow([resource["ResourceType"], resource["ResourceId"], resource["ResourceName"], alarms_configured,
+                             resource["Region"]])
+
+    sink.write("monitoring_resources", all_resources, SINK_FIELDS, "resource_id")
+    sink.close({"resources": total_resources, "alarms": total_alarms_configured,
+                "insufficient_data": insufficient_count, "ok": ok_count, "alarm": in_alarm_count})
 
     print("Monitoring audit completed. Output saved to monitoring_audit.csv")
+    for region in region_names:
+        caches[region].print_stats()
+        alarm_stores[region].print_stats()
+    print_region_timings(region_timings)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 cwaudit.py <AWS_PROFILE>")
-        sys.exit(1)
-
-    PROFILE_NAME = sys.argv[1]  # Get the profile name from the command-line argument
+    parser = argparse.ArgumentParser(description="Audit CloudWatch alarm coverage for EC2, RDS and load balancer resources.")
+    parser.add_argument("profile", help="AWS profile to audit")
+    add_region_arguments(parser)
+    invcache.add_cache_arguments(parser)
+    alarmstore.add_alarm_store_arguments(parser)
+    auditsink.add_sink_arguments(parser)
+    args = parser.parse_args()
+
+    PROFILE_NAME = args.profile  # Get the profile name from the command-line argument
     try:
-        audit_monitoring_resources(PROFILE_NAME)
+        audit_monitoring_resources(PROFILE_NAME, regions=args.regions, cache_ttl=args.cache_ttl, refresh_cache=args.refresh_cache,
+                                   incremental_alarms=args.incremental_alarms,
+                                   alarm_store_max_age=args.alarm_store_max_age, sqlite_path=args.sqlite)
     except botocore.exceptions.NoCredentialsError:
         print("No credentials found. Please ensure your profile is set up correctly in .aws/config.")
+        sys.exit(1)
@@ -1,35 +1,15 @@
-import boto3
+import awsclients
+from snapshotindex import classify_snapshots
 
 def fetch_snapshots_by_profile(profile_name):
     # Use the specified AWS profile
-    session = boto3.Session(profile_name=profile_name)
-    ec2 = session.client('ec2')
-
-    # Fetch AMIs created by AWS Backup
-    amis = ec2.describe_images(Owners=['self'])['Images']
-    awsbackup_amis = [ami['ImageId'] for ami in amis if 'awsbackup' in ami.get('Name', '').lower()]
-
-    # Fetch all snapshots
-    snapshots = ec2.describe_snapshots(OwnerIds=['self'])['Snapshots']
+    ec2 = awsclients.get_client(profile_name, 'ec2')
 
     # Separate snapshots into two lists
     attached_snapshots = []
     unattached_snapshots = []
 
-    for snapshot in snapshots:
-        snapshot_id = snapshot['SnapshotId']
-        # Check if the snapshot is attached to any AWS Backup AMI
-        is_attached = False
-        for ami in amis:
-            if ami['ImageId'] in awsbackup_amis:
-                for block_device in ami.get('BlockDeviceMappings', []):
-                    # Safely check if 'Ebs' exists in the block device
-                    if 'Ebs' in block_device and block_device['Ebs']['SnapshotId'] == snapshot_id:
-                        is_attached = True
-                        break
-            if is_attached:
-                break
-
+    for snapshot_id, is_attached in classify_snapshots(ec2):
         if is_attached:
             attached_snapshots.append(snapshot_id)
         else:
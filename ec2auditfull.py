@@ -1,8 +1,32 @@
-import boto3
+import argparse
 import botocore
 import datetime
 import csv
 import sys
+import tempfile
+import threading
+
+import auditsink
+import awsclients
+import configbackend
+import invcache
+import metricbatch
+import snapshotsize
+from pagecollect import collect_families, print_page_stats
+from regionfanout import add_region_arguments, fan_out, print_region_timings, regional_clients, resolve_regions
+from streamcsv import StreamOutput, add_stream_arguments, batched
+
+# Utilization columns cover this many whole days, ending at the last UTC midnight.
+UTILIZATION_DAYS = 14
+# GetMetricData batches in flight at once per region.
+METRIC_WORKERS = 4
+# Instance states in which an instance still needs its AMI.
+LIVE_INSTANCE_STATES = {"pending", "running", "stopping", "stopped"}
+ORPHAN_REASONS = {
+    "AMI": "No running or stopped instances",
+    "EBS Volume": "Available (not attached)",
+    "EBS Snapshot": "Source volume deleted, not used by any AMI",
+}
 
 def get_age_from_dt(dt):
     """
@@ -23,146 +47,485 @@ def get_age_from_dt(dt):
         years = days // 365
         return f"{years} years old"
 
-def audit_ec2_resources(profile_name):
-    # Create a boto3 session using the specified read-only profile.
-    session = boto3.Session(profile_name=profile_name)
-    ec2_client = session.client('ec2')
+def iter_instances(ec2_client, cache, stats):
+    for page in cache.pages(ec2_client, 'describe_instances', stats,
+                           PaginationConfig={'PageSize': 1000}):
+        for reservation in page['Reservations']:
+            for instance in reservation['Instances']:
+                instance_id = instance.get('InstanceId', 'N/A')
+                name = next((tag.get('Value') for tag in instance.get('Tags', []) if tag.get('Key') == 'Name'), "N/A")
+                platform = instance.get('Platform', 'Linux')
+                attached_vols = [
+                    bdm['Ebs']['VolumeId']
+                    for bdm in instance.get('BlockDeviceMappings', []) if 'Ebs' in bdm
+                ]
+                instance_state = instance['State']['Name']
+                yield {
+                    "Name": name,
+                    "InstanceId": instance_id,
+                    "Platform": platform,
+                    "AttachedVolumes": ", ".join(attached_vols) if attached_vols else "None",
+                    "State": instance_state,
+                    "ImageId": instance.get('ImageId', 'N/A'),
+                    "CpuP95": "N/A"
+                }
 
-    # ----------------------- EC2 Instances ---------------------------
-    ec2_response = ec2_client.describe_instances()
+def collect_instances(ec2_client, cache, stats):
     instance_name_map = {}
     ec2_instances = []
-    instance_ami_usage = {}
-
-    for reservation in ec2_response['Reservations']:
-        for instance in reservation['Instances']:
-            instance_id = instance.get('InstanceId', 'N/A')
-            name = next((tag.get('Value') for tag in instance.get('Tags', []) if tag.get('Key') == 'Name'), "N/A")
-            platform = instance.get('Platform', 'Linux')
-            attached_vols = [
-                bdm['Ebs']['VolumeId']
-                for bdm in instance.get('BlockDeviceMappings', []) if 'Ebs' in bdm
-            ]
-            instance_state = instance['State']['Name']
-            instance_name_map[instance_id] = name
-            image_id = instance.get('ImageId', 'N/A')
-            instance_ami_usage.setdefault(image_id, []).append(instance_id)
-            ec2_instances.append({
-                "Name": name,
-                "InstanceId": instance_id,
-                "Platform": platform,
-                "AttachedVolumes": ", ".join(attached_vols) if attached_vols else "None",
-                "State": instance_state
-            })
-
-    # ----------------------- AMIs (Owned by Self) ---------------------------
-    images_response = ec2_client.describe_images(Owners=['self'])
-    ami_list = []
-    for image in images_response['Images']:
-        ami_id = image.get('ImageId', 'N/A')
-        ami_name = image.get('Name', 'N/A')
-        creation_date_str = image.get('CreationDate')
+    for instance in iter_instances(ec2_client, cache, stats):
+        instance_name_map[instance["InstanceId"]] = instance["Name"]
+        ec2_instances.append(instance)
+    return ec2_instances, instance_name_map
+
+def iter_amis(ec2_client, cache, stats):
+    for page in cache.pages(ec2_client, 'describe_images', stats, Owners=['self'],
+                           PaginationConfig={'PageSize': 1000}):
+        for image in page['Images']:
+            ami_id = image.get('ImageId', 'N/A')
+            ami_name = image.get('Name', 'N/A')
+            creation_date_str = image.get('CreationDate')
+            try:
+                creation_dt = datetime.datetime.strptime(creation_date_str, "%Y-%m-%dT%H:%M:%S.%fZ")
+            except ValueError:
+                creation_dt = datetime.datetime.strptime(creation_date_str, "%Y-%m-%dT%H:%M:%SZ")
+            age = get_age_from_dt(creation_dt)
+            added_tags = ", ".join([f"{tag.get('Key')}={tag.get('Value')}" for tag in image.get('Tags', [])]) if image.get('Tags') else "None"
+            snapshot_ids = [bdm['Ebs']['SnapshotId'] for bdm in image.get('BlockDeviceMappings', [])
+                            if 'SnapshotId' in bdm.get('Ebs', {})]
+            yield {
+                "AMI_ID": ami_id,
+                "AMI_Name": ami_name,
+                "Age": age,
+                "CreationDT": creation_dt,
+                "AddedTags": added_tags,
+                "SnapshotIds": snapshot_ids
+            }
+
+def collect_amis(ec2_client, cache, stats):
+    return sorted(iter_amis(ec2_client, cache, stats), key=lambda x: x["CreationDT"], reverse=True)
+
+def iter_volumes(ec2_client, cache, stats):
+    # InstanceName is filled in by the caller once the instance family is done.
+    for page in cache.pages(ec2_client, 'describe_volumes', stats,
+                           PaginationConfig={'PageSize': 500}):
+        for volume in page['Volumes']:
+            vol_id = volume.get('VolumeId', 'N/A')
+            backup_status = next(
+                (tag.get('Value') for tag in volume.get('Tags', []) if tag.get('Key', '').lower() == 'backup'),
+                "No Backup Tag"
+            )
+            attachments = volume.get('Attachments', [])
+            attached_instance = attachments[0]['InstanceId'] if attachments else "Not Attached"
+            yield {
+                "VolumeID": vol_id,
+                "State": volume.get('State', 'N/A'),
+                "AttachedInstance": attached_instance,
+                "InstanceName": "N/A",
+                "BackupStatus": backup_status,
+                "ReadOps": "N/A",
+                "WriteOps": "N/A"
+            }
+
+def collect_volumes(ec2_client, cache, stats):
+    return list(iter_volumes(ec2_client, cache, stats))
+
+def iter_snapshots(ec2_client, cache, stats):
+    for page in cache.pages(ec2_client, 'describe_snapshots', stats, OwnerIds=['self'],
+                           PaginationConfig={'PageSize': 1000}):
+        for snapshot in page['Snapshots']:
+            snapshot_id = snapshot.get('SnapshotId', 'N/A')
+            volume_id = snapshot.get('VolumeId', 'N/A')
+            start_time = snapshot.get('StartTime')
+            age = get_age_from_dt(start_time)
+            created_by = next(
+                (tag.get('Value') for tag in snapshot.get('Tags', []) if tag.get('Key', '').lower() == 'createdby'),
+                "N/A"
+            )
+            yield {
+                "SnapshotID": snapshot_id,
+                "VolumeID": volume_id,
+                "Age": age,
+                "StartTime": start_time,
+                "CreatedBy": created_by,
+                "IncrementalSize": "N/A"
+            }
+
+def collect_snapshots(ec2_client, cache, stats):
+    return sorted(iter_snapshots(ec2_client, cache, stats), key=lambda x: x["StartTime"], reverse=True)
+
+class OrphanIndex:
+    """
+    Hash-set join of one region's inventory into its orphaned resources:
+    AMIs no live instance uses, available volumes, and snapshots whose
+    volume is gone and which no AMI references. Collectors feed it the rows
+    they already yield, so it needs no API calls. Only the ids the joins
+    need are kept in memory; candidate orphans are spilled to a temporary
+    file, and orphans() filters them in one pass once every family is in.
+    """
+
+    def __init__(self):
+        self.used_amis = set()
+        self.ami_snapshots = set()
+        self.volume_ids = set()
+        self._lock = threading.Lock()
+        self._candidates = tempfile.TemporaryFile("w+", newline="")
+        self._writer = csv.writer(self._candidates)
+
+    def _spill(self, resource_type, resource_id, detail, age):
+        with self._lock:
+            self._writer.writerow([resource_type, resource_id, detail, age])
+
+    def add_instance(self, inst):
+        if inst["State"] in LIVE_INSTANCE_STATES:
+            self.used_amis.add(inst["ImageId"])
+
+    def add_ami(self, ami):
+        self.ami_snapshots.update(ami["SnapshotIds"])
+        self._spill("AMI", ami["AMI_ID"], ami["AMI_Name"], ami["Age"])
+
+    def add_volume(self, vol):
+        self.volume_ids.add(vol["VolumeID"])
+        if vol["State"] == "available":
+            self._spill("EBS Volume", vol["VolumeID"], vol["BackupStatus"], "N/A")
+
+    def add_snapshot(self, snap):
+        self._spill("EBS Snapshot", snap["SnapshotID"], snap["VolumeID"], snap["Age"])
+
+    def is_orphan(self, resource_type, resource_id, detail):
+        if resource_type == "AMI":
+            return resource_id not in self.used_amis
+        if resource_type == "EBS Snapshot":
+            return detail not in self.volume_ids and resource_id not in self.ami_snapshots
+        return True
+
+    def orphans(self):
+        """Yield one orphan row per unused AMI, available volume and orphaned snapshot, then drop the spill file."""
+        self._candidates.seek(0)
         try:
-            creation_dt = datetime.datetime.strptime(creation_date_str, "%Y-%m-%dT%H:%M:%S.%fZ")
-        except ValueError:
-            creation_dt = datetime.datetime.strptime(creation_date_str, "%Y-%m-%dT%H:%M:%SZ")
-        age = get_age_from_dt(creation_dt)
-        added_tags = ", ".join([f"{tag.get('Key')}={tag.get('Value')}" for tag in image.get('Tags', [])]) if image.get('Tags') else "None"
-        ami_list.append({
-            "AMI_ID": ami_id,
-            "AMI_Name": ami_name,
-            "Age": age,
-            "CreationDT": creation_dt,
-            "AddedTags": added_tags
-        })
-    ami_list = sorted(ami_list, key=lambda x: x["CreationDT"], reverse=True)
-
-    # ----------------------- EBS Volumes ---------------------------
-    volumes_response = ec2_client.describe_volumes()
-    volume_list = []
-    for volume in volumes_response['Volumes']:
-        vol_id = volume.get('VolumeId', 'N/A')
-        backup_status = next(
-            (tag.get('Value') for tag in volume.get('Tags', []) if tag.get('Key', '').lower() == 'backup'),
-            "No Backup Tag"
-        )
-        attachments = volume.get('Attachments', [])
-        attached_instance = attachments[0]['InstanceId'] if attachments else "Not Attached"
-        instance_name = instance_name_map.get(attached_instance, "N/A") if attached_instance != "Not Attached" else "N/A"
-        volume_list.append({
-            "VolumeID": vol_id,
-            "AttachedInstance": attached_instance,
-            "InstanceName": instance_name,
-            "BackupStatus": backup_status
-        })
-
-    # ----------------------- EBS Snapshots ---------------------------
-    snapshots_response = ec2_client.describe_snapshots(OwnerIds=['self'])
-    snapshot_list = []
-    for snapshot in snapshots_response['Snapshots']:
-        snapshot_id = snapshot.get('SnapshotId', 'N/A')
-        volume_id = snapshot.get('VolumeId', 'N/A')
-        start_time = snapshot.get('StartTime')
-        age = get_age_from_dt(start_time)
-        created_by = next(
-            (tag.get('Value') for tag in snapshot.get('Tags', []) if tag.get('Key', '').lower() == 'createdby'),
-            "N/A"
-        )
-        snapshot_list.append({
-            "SnapshotID": snapshot_id,
-            "VolumeID": volume_id,
-            "Age": age,
-            "StartTime": start_time,
-            "CreatedBy": created_by
-        })
-    snapshot_list = sorted(snapshot_list, key=lambda x: x["StartTime"], reverse=True)
-
-    # ----------------------- Save to CSV Files ---------------------------
-    # Save EC2 Instances
-    with open('ec2_instances.csv', 'w', newline='') as f_ec2:
-        writer = csv.writer(f_ec2)
-        writer.writerow([f"Total Instance Count: {len(ec2_instances)}"])
-        writer.writerow(["Name", "Instance ID", "Platform", "Attached Volumes", "State"])
-        for inst in ec2_instances:
-            writer.writerow([inst["Name"], inst["InstanceId"], inst["Platform"], inst["AttachedVolumes"], inst["State"]])
-
-    # Save AMIs
-    with open('amis.csv', 'w', newline='') as f_ami:
-        writer = csv.writer(f_ami)
-        writer.writerow([f"Total AMI Count: {len(ami_list)}"])
-        writer.writerow(["AMI ID", "AMI Name", "Age (newest first)", "Added Tags"])
-        for ami in ami_list:
-            writer.writerow([ami["AMI_ID"], ami["AMI_Name"], ami["Age"], ami["AddedTags"]])
-
-    # Save EBS Volumes
-    with open('ebs_volumes.csv', 'w', newline='') as f_vol:
-        writer = csv.writer(f_vol)
-        writer.writerow([f"Total EBS Volumes Count: {len(volume_list)}"])
-        writer.writerow(["Volume ID", "Attached Instance", "Instance Name", "Backup Status"])
-        for vol in volume_list:
-            writer.writerow([vol["VolumeID"], vol["AttachedInstance"], vol["InstanceName"], vol["BackupStatus"]])
-
-    # Save EBS Snapshots
-    with open('ebs_snapshots.csv', 'w', newline='') as f_snap:
-        writer = csv.writer(f_snap)
-        writer.writerow([f"Total EBS Snapshots Count: {len(snapshot_list)}"])
-        writer.writerow(["Snapshot ID", "Attached Volume", "Age (newest first)", "Created By"])
-        for snap in snapshot_list:
-            writer.writerow([snap["SnapshotID"], snap["VolumeID"], snap["Age"], snap["CreatedBy"]])
+            for resource_type, resource_id, detail, age in csv.reader(self._candidates):
+                if self.is_orphan(resource_type, resource_id, detail):
+                    yield {"ResourceType": resource_type, "ResourceId": resource_id,
+                           "Reason": ORPHAN_REASONS[resource_type], "Detail": detail, "Age": age}
+        finally:
+            self._candidates.close()
+
+def add_utilization(instances, volumes, cw_client, metric_cache):
+    """
+    Fill in the p95 CPUUtilization of instances and the total read and write
+    operations of volumes over UTILIZATION_DAYS, through batched GetMetricData.
+    Resources CloudWatch has no datapoints for keep "N/A".
+    """
+    period = UTILIZATION_DAYS * 86400
+    queries = {}
+    for inst in instances:
+        queries["CpuP95", inst["InstanceId"]] = metricbatch.metric_query(
+            "AWS/EC2", "CPUUtilization", {"InstanceId": inst["InstanceId"]}, "p95", period)
+    for vol in volumes:
+        for column, metric_name in (("ReadOps", "VolumeReadOps"), ("WriteOps", "VolumeWriteOps")):
+            queries[column, vol["VolumeID"]] = metricbatch.metric_query(
+                "AWS/EBS", metric_name, {"VolumeId": vol["VolumeID"]}, "Sum", period)
+    start_time, end_time = metricbatch.daily_window(UTILIZATION_DAYS)
+    try:
+        datapoints = metricbatch.fetch(cw_client, queries, start_time, end_time, METRIC_WORKERS, cache=metric_cache)
+    except botocore.exceptions.ClientError:
+        datapoints = {key: None for key in queries}
+
+    # The window is one period, but be safe should CloudWatch split it.
+    for inst in instances:
+        points = datapoints["CpuP95", inst["InstanceId"]]
+        if points is None:
+            inst["CpuP95"] = "Error"
+        elif points:
+            inst["CpuP95"] = f"{max(value for _, value in points):.1f}"
+    for vol in volumes:
+        for column in ("ReadOps", "WriteOps"):
+            points = datapoints[column, vol["VolumeID"]]
+            if points is None:
+                vol[column] = "Error"
+            elif points:
+                vol[column] = int(sum(value for _, value in points))
+
+def add_snapshot_sizes(snapshots, ebs_client, pair_cache, workers):
+    """Fill in each snapshot's incremental size in bytes along its volume's lineage."""
+    sizes = snapshotsize.incremental_sizes(ebs_client, snapshots, pair_cache, workers)
+    for snap in snapshots:
+        snap["IncrementalSize"] = sizes.get(snap["SnapshotID"], "N/A")
+
+def format_gib(size):
+    return size if isinstance(size, str) else f"{size / 1024 ** 3:.2f}"
+
+def collect_region(ec2_client, cache, metrics=None, snapshot_sizes=None):
+    """
+    Collect all four families for one region concurrently.
+    With metrics, a (CloudWatch client, DatapointCache) pair, instances and
+    volumes also get their utilization columns; with snapshot_sizes, an
+    (EBS client, PairCache, workers) triple, snapshots get their incremental size.
+    """
+    results, page_stats = collect_families({
+        "instances": lambda stats: collect_instances(ec2_client, cache, stats),
+        "amis": lambda stats: collect_amis(ec2_client, cache, stats),
+        "volumes": lambda stats: collect_volumes(ec2_client, cache, stats),
+        "snapshots": lambda stats: collect_snapshots(ec2_client, cache, stats),
+    })
+    ec2_instances, instance_name_map = results["instances"]
+    volume_list = results["volumes"]
+
+    for vol in volume_list:
+        if vol["AttachedInstance"] != "Not Attached":
+            vol["InstanceName"] = instance_name_map.get(vol["AttachedInstance"], "N/A")
+
+    if metrics:
+        add_utilization(ec2_instances, volume_list, *metrics)
+    if snapshot_sizes:
+        add_snapshot_sizes(results["snapshots"], *snapshot_sizes)
+
+    index = OrphanIndex()
+    for inst in ec2_instances:
+        index.add_instance(inst)
+    for ami in results["amis"]:
+        index.add_ami(ami)
+    for vol in volume_list:
+        index.add_volume(vol)
+    for snap in results["snapshots"]:
+        index.add_snapshot(snap)
+
+    return {
+        "instances": ec2_instances,
+        "amis": results["amis"],
+        "volumes": volume_list,
+        "snapshots": results["snapshots"],
+        "orphans": list(index.orphans()),
+        "page_stats": page_stats,
+    }
+
+# record type -> (indexed id column, {column: row key}) for the audit sink.
+SINK_RECORDS = {
+    "ec2_instances": ("instance_id", {
+        "instance_id": "InstanceId", "name": "Name", "platform": "Platform",
+        "attached_volumes": "AttachedVolumes", "state": "State", "region": "Region",
+        "cpu_p95_14d": "CpuP95"}),
+    "amis": ("ami_id", {
+        "ami_id": "AMI_ID", "ami_name": "AMI_Name", "creation_date": "CreationDT", "age": "Age",
+        "added_tags": "AddedTags", "region": "Region"}),
+    "ebs_volumes": ("volume_id", {
+        "volume_id": "VolumeID", "attached_instance": "AttachedInstance", "instance_name": "InstanceName",
+        "backup_status": "BackupStatus", "region": "Region",
+        "read_ops_14d": "ReadOps", "write_ops_14d": "WriteOps"}),
+    "ebs_snapshots": ("snapshot_id", {
+        "snapshot_id": "SnapshotID", "volume_id": "VolumeID", "start_time": "StartTime", "age": "Age",
+        "created_by": "CreatedBy", "region": "Region", "incremental_bytes": "IncrementalSize"}),
+    "ec2_orphans": ("resource_id", {
+        "resource_type": "ResourceType", "resource_id": "ResourceId", "reason": "Reason", "detail": "Detail",
+        "age": "Age", "region": "Region"}),
+}
+
+# family -> (CSV file, classic summary label, header, row function) for both output layouts.
+CSV_TABLES = {
+    "instances": ("ec2_instances.csv", "Total Instance Count",
+                  ["Name", "Instance ID", "Platform", "Attached Volumes", "State", "Region", "CPU p95 % (14d)"],
+                  lambda inst: [inst["Name"], inst["InstanceId"], inst["Platform"], inst["AttachedVolumes"],
+                                inst["State"], inst["Region"], inst["CpuP95"]]),
+    "amis": ("amis.csv", "Total AMI Count",
+             ["AMI ID", "AMI Name", "Age (newest first)", "Added Tags", "Region"],
+             lambda ami: [ami["AMI_ID"], ami["AMI_Name"], ami["Age"], ami["AddedTags"], ami["Region"]]),
+    "volumes": ("ebs_volumes.csv", "Total EBS Volumes Count",
+                ["Volume ID", "Attached Instance", "Instance Name", "Backup Status", "Region",
+                 "Read Ops (14d)", "Write Ops (14d)"],
+                lambda vol: [vol["VolumeID"], vol["AttachedInstance"], vol["InstanceName"], vol["BackupStatus"],
+                             vol["Region"], vol["ReadOps"], vol["WriteOps"]]),
+    "snapshots": ("ebs_snapshots.csv", "Total EBS Snapshots Count",
+                  ["Snapshot ID", "Attached Volume", "Age (newest first)", "Created By", "Region",
+                   "Incremental Size (GiB)"],
+                  lambda snap: [snap["SnapshotID"], snap["VolumeID"], snap["Age"], snap["CreatedBy"],
+                                snap["Region"], format_gib(snap["IncrementalSize"])]),
+    "orphans": ("ec2_orphans.csv", "Total Orphaned Resources",
+                ["Resource Type", "Resource ID", "Reason", "Detail", "Age", "Region"],
+                lambda orphan: [orphan["ResourceType"], orphan["ResourceId"], orphan["Reason"], orphan["Detail"],
+                                orphan["Age"], orphan["Region"]]),
+}
+# family -> audit sink record type.
+SINK_TYPES = {"instances": "ec2_instances", "amis": "amis", "volumes": "ebs_volumes", "snapshots": "ebs_snapshots",
+              "orphans": "ec2_orphans"}
+
+def stream_family(items, region, family, streams, sink, enrich=None):
+    """
+    Write a family's rows to its CSV and the sink a batch at a time, without
+    keeping them. enrich, if given, is called on each batch first.
+    """
+    _, _, _, row = CSV_TABLES[family]
+    key, fields = SINK_RECORDS[SINK_TYPES[family]]
+    for batch in batched(items):
+        if enrich:
+            enrich(batch)
+        for item in batch:
+            item["Region"] = region
+            streams.files[family].write(row(item))
+        sink.write(SINK_TYPES[family], batch, fields, key)
+
+def stream_region(ec2_client, cache, region, streams, sink, metrics=None):
+    """
+    Streaming counterpart of collect_region: rows are written as pages arrive.
+    Instances go first, since volumes need their names; only the id -> name map
+    and the orphan index's id sets are kept. With metrics, utilization is fetched
+    for each batch before it is written.
+    """
+    instance_name_map = {}
+    index = OrphanIndex()
+    instance_metrics = volume_metrics = None
+    if metrics:
+        instance_metrics = lambda batch: add_utilization(batch, [], *metrics)
+        volume_metrics = lambda batch: add_utilization([], batch, *metrics)
+
+    def instances(stats):
+        for instance in iter_instances(ec2_client, cache, stats):
+            instance_name_map[instance["InstanceId"]] = instance["Name"]
+            index.add_instance(instance)
+            yield instance
+
+    def named_volumes(stats):
+        for vol in iter_volumes(ec2_client, cache, stats):
+            if vol["AttachedInstance"] != "Not Attached":
+                vol["InstanceName"] = instance_name_map.get(vol["AttachedInstance"], "N/A")
+            index.add_volume(vol)
+            yield vol
+
+    def indexed(items, add):
+        for item in items:
+            add(item)
+            yield item
+
+    _, page_stats = collect_families({
+        "instances": lambda stats: stream_family(instances(stats), region, "instances", streams, sink,
+                                                 instance_metrics)})
+    _, more_stats = collect_families({
+        "amis": lambda stats: stream_family(indexed(iter_amis(ec2_client, cache, stats), index.add_ami),
+                                            region, "amis", streams, sink),
+        "volumes": lambda stats: stream_family(named_volumes(stats), region, "volumes", streams, sink,
+                                               volume_metrics),
+        "snapshots": lambda stats: stream_family(indexed(iter_snapshots(ec2_client, cache, stats),
+                                                         index.add_snapshot),
+                                                 region, "snapshots", streams, sink),
+    })
+    page_stats.update(more_stats)
+    # Every family is in, so the joins are complete.
+    stream_family(index.orphans(), region, "orphans", streams, sink)
+    return {"page_stats": page_stats}
+
+def audit_ec2_resources(profile_name, regions=None, cache_ttl=invcache.DEFAULT_TTL, refresh_cache=False,
+                        sqlite_path=None, stream=False,
+                        backend=configbackend.DEFAULT_BACKEND, config_aggregator=None, utilization=False,
+                        snapshot_sizes=False, snapshot_size_workers=snapshotsize.DEFAULT_WORKERS):
+    if stream and snapshot_sizes:
+        # A snapshot's size depends on its predecessor, which may arrive on a later page.
+        raise ValueError("snapshot sizes need every snapshot before any row is written; not available with stream")
+    # Clients come from the shared factory for the specified read-only profile.
+    sink = auditsink.open_sink(profile_name, "ec2auditfull", sqlite_path)
+    region_names = resolve_regions(profile_name, regions)
+    ec2_clients = regional_clients(profile_name, 'ec2', region_names)
+    # Collectors read through the inventory cache, optionally behind AWS Config.
+    caches = {region: configbackend.open_backend(profile_name, region,
+                                                 invcache.open_cache(profile_name, region, cache_ttl, refresh_cache),
+                                                 backend, config_aggregator)
+              for region in region_names}
+    # Utilization datapoints are cached for the day alongside the inventory cache. The cache holds
+    # every datapoint until the run ends, so streamed runs roll each batch up and keep nothing.
+    metrics = {}
+    if utilization:
+        for region in region_names:
+            metric_cache = metricbatch.DatapointCache(profile_name, region, enabled=cache_ttl > 0 and not stream)
+            if refresh_cache:
+                metric_cache.invalidate()
+            metrics[region] = (awsclients.get_client(profile_name, 'cloudwatch', region, concurrency=METRIC_WORKERS),
+                               metric_cache)
+
+    # Incremental snapshot sizes, per region; counted block pairs are cached for good.
+    sizers = {}
+    if snapshot_sizes:
+        for region in region_names:
+            sizers[region] = (awsclients.get_client(profile_name, 'ebs', region, concurrency=snapshot_size_workers),
+                              snapshotsize.PairCache(profile_name, region), snapshot_size_workers)
+
+    if stream:
+        # ----------------------- Stream every region straight to disk ---------------------------
+        streams = StreamOutput("ec2_audit.manifest.json")
+        for family, (path, _, header, _) in CSV_TABLES.items():
+            streams.open(family, path, header)
+        region_results, region_timings = fan_out(
+            region_names, lambda region: stream_region(ec2_clients[region], caches[region], region, streams, sink,
+                                                       metrics.get(region)))
+        counts = {family: streams.files[family].rows for family in CSV_TABLES}
+        streams.close({label: counts[family] for family, (_, label, _, _) in CSV_TABLES.items()})
+        sink.close(counts)
+        output_files = [path for path, _, _, _ in CSV_TABLES.values()] + [streams.manifest_path]
+    else:
+        # ----------------------- Collect every region concurrently ---------------------------
+        region_results, region_timings = fan_out(
+            region_names, lambda region: collect_region(ec2_clients[region], caches[region], metrics.get(region),
+                                                        sizers.get(region)))
+
+        families = {family: [] for family in CSV_TABLES}
+        for region, result in region_results.items():
+            for family, rows in families.items():
+                for row in result[family]:
+                    row["Region"] = region
+                rows.extend(result[family])
+        if len(region_names) > 1:
+            families["amis"].sort(key=lambda x: x["CreationDT"], reverse=True)
+            families["snapshots"].sort(key=lambda x: x["StartTime"], reverse=True)
+
+        # ----------------------- Save to CSV Files ---------------------------
+        for family, (path, label, header, row) in CSV_TABLES.items():
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([f"{label}: {len(families[family])}"])
+                writer.writerow(header)
+                for item in families[family]:
+                    writer.writerow(row(item))
+
+        for family, rows in families.items():
+            key, fields = SINK_RECORDS[SINK_TYPES[family]]
+            sink.write(SINK_TYPES[family], rows, fields, key)
+        sink.close({family: len(rows) for family, rows in families.items()})
+        output_files = [path for path, _, _, _ in CSV_TABLES.values()]
 
     print("Output saved to CSV files:")
-    print("  ec2_instances.csv")
-    print("  amis.csv")
-    print("  ebs_volumes.csv")
-    print("  ebs_snapshots.csv")
+    for path in output_files:
+        print(f"  {path}")
+    for region, result in region_results.items():
+        print_page_stats(result["page_stats"], region)
+        caches[region].print_stats()
+        if region in metrics:
+            metrics[region][1].save()
+            metrics[region][1].print_stats()
+        if region in sizers:
+            sizers[region][1].save()
+            sizers[region][1].print_stats()
+    print_region_timings(region_timings)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 ec2auditfull.py <AWS_PROFILE>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Audit EC2 instances, AMIs, EBS volumes and snapshots.")
+    parser.add_argument("profile", help="AWS profile to audit")
+    add_region_arguments(parser)
+    invcache.add_cache_arguments(parser)
+    configbackend.add_backend_arguments(parser)
+    auditsink.add_sink_arguments(parser)
+    add_stream_arguments(parser)
+    parser.add_argument("--utilization", action="store_true",
+                        help="fill the CPU and volume I/O columns from CloudWatch (one GetMetricData query "
+                             "per instance and two per volume; not cached with --stream)")
+    snapshotsize.add_snapshot_size_arguments(parser)
+    args = parser.parse_args()
+    if args.stream and args.snapshot_sizes:
+        parser.error("--snapshot-sizes cannot be combined with --stream")
 
-    PROFILE_NAME = sys.argv[1]  # Get the profile name from the command-line argument
+    PROFILE_NAME = args.profile  # Get the profile name from the command-line argument
     try:
-        audit_ec2_resources(PROFILE_NAME)
+        audit_ec2_resources(PROFILE_NAME, regions=args.regions, cache_ttl=args.cache_ttl, refresh_cache=args.refresh_cache,
+                            sqlite_path=args.sqlite, stream=args.stream,
+                            backend=args.backend, config_aggregator=args.config_aggregator,
+                            utilization=args.utilization, snapshot_sizes=args.snapshot_sizes,
+                            snapshot_size_workers=max(args.snapshot_size_workers, 1))
     except botocore.exceptions.NoCredentialsError:
         print("No credentials found. Please ensure your profile is set up correctly in .aws/config.")
+        sys.exit(1)
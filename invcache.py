@@ -0,0 +1,145 @@
+import argparse
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from pagecollect import PageStats, iter_pages
+
+# Raw describe responses are kept for this many seconds unless overridden.
+DEFAULT_TTL = 900
+
+
+def cache_root():
+    """Directory holding every on-disk cache used by the audit scripts."""
+    return os.environ.get("AWS_AUDIT_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "aws-audit"))
+
+
+def json_default(value):
+    if isinstance(value, datetime.datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def json_object_hook(obj):
+    if len(obj) == 1 and "$dt" in obj:
+        return datetime.datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+class InventoryCache:
+    """
+    Per-profile, per-region cache of raw paginated describe responses.
+    Each (operation, parameters) pair is one gzip file holding one compact
+    JSON page per line, so any audit started within the TTL replays the
+    pages instead of calling the API.
+    """
+
+    def __init__(self, profile_name, region, ttl=DEFAULT_TTL):
+        self.profile_name = profile_name
+        self.region = region or "default"
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return os.path.join(cache_root(), "inventory", self.profile_name, self.region)
+
+    def path_for(self, operation, params):
+        # Page sizing does not change the result set, so it is not part of the key.
+        key_params = {k: v for k, v in params.items() if k != "PaginationConfig"}
+        digest = hashlib.sha1(json.dumps(key_params, sort_keys=True).encode()).hexdigest()[:12]
+        return os.path.join(self.directory, f"{operation}-{digest}.jsonl.gz")
+
+    def _fresh(self, path):
+        try:
+            return self.ttl > 0 and time.time() - os.path.getmtime(path) < self.ttl
+        except OSError:
+            return False
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def pages(self, client, operation, stats=None, **kwargs):
+        """Yield pages for a describe call from the cache, or from the API on a miss."""
+        if stats is None:
+            stats = PageStats(operation)
+        path = self.path_for(operation, kwargs)
+        if self._fresh(path):
+            self._count(True)
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    stats.pages += 1
+                    yield json.loads(line, object_hook=json_object_hook)
+            return
+
+        self._count(False)
+        if self.ttl <= 0:
+            yield from iter_pages(client, operation, stats, **kwargs)
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with gzip.open(tmp_path, "wt") as f:
+                for page in iter_pages(client, operation, stats, **kwargs):
+                    page.pop("ResponseMetadata", None)
+                    f.write(json.dumps(page, default=json_default, separators=(",", ":")))
+                    f.write("\n")
+                    yield page
+            # Only a fully consumed listing is published to other audits.
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def invalidate(self):
+        """Drop every cached response for this profile and region."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def print_stats(self):
+        print(f"Inventory cache ({self.profile_name}/{self.region}): {self.hits} hits, {self.misses} misses")
+
+
+def invalidate(profile_name, region=None):
+    """Drop cached responses for a profile, for one region or all of them."""
+    path = os.path.join(cache_root(), "inventory", profile_name)
+    if region:
+        path = os.path.join(path, region)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def add_cache_arguments(parser):
+    """Add the --cache-ttl / --refresh-cache options shared by the audit scripts."""
+    parser.add_argument("--cache-ttl", type=int, default=DEFAULT_TTL,
+                        help=f"seconds a cached describe response stays valid, 0 disables (default {DEFAULT_TTL})")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="invalidate the inventory cache for this profile and region first")
+
+
+def open_cache(profile_name, region, ttl=DEFAULT_TTL, refresh=False):
+    cache = InventoryCache(profile_name, region, ttl)
+    if refresh:
+        cache.invalidate()
+    return cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the shared inventory cache.")
+    parser.add_argument("action", choices=["invalidate"])
+    parser.add_argument("profile", help="AWS profile whose cache to drop")
+    parser.add_argument("--region", help="only drop this region (default: all regions)")
+    args = parser.parse_args()
+
+    invalidate(args.profile, args.region)
+    print(f"Inventory cache invalidated for {args.profile}" + (f" ({args.region})" if args.region else ""))
@@ -1,5 +1,21 @@
+import argparse
+import datetime
+import os
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+
+import awsclients
+import awsmetrics
+import cwaudit
+import ec2auditfull
+import rdsaudit
+import s3audit
+import sgaudit
 
 # Define available AWS accounts and their profiles
 AWS_ACCOUNTS = {
@@ -13,6 +29,108 @@ AWS_ACCOUNTS = {
     "8": {"name": "Audit Account", "profile": "audit-audit-readonly"}
 }
 
+# Audits offered in the menu, keyed by menu choice: (label, script)
+AUDITS = {
+    "1": ("EC2 Audit", "ec2auditfull.py"),
+    "2": ("RDS Audit", "rdsaudit.py"),
+    "3": ("Security Audit", "sgaudit.py"),
+    "4": ("Monitoring Audit", "cwaudit.py"),
+    "5": ("S3 Audit", "s3audit.py"),
+}
+
+# The same audits as functions, for running them in this process
+AUDIT_FUNCTIONS = {
+    "1": ec2auditfull.audit_ec2_resources,
+    "2": rdsaudit.audit_rds_resources,
+    "3": sgaudit.audit_security_groups,
+    "4": cwaudit.audit_monitoring_resources,
+    "5": s3audit.audit_s3_buckets,
+}
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def run_in_process(profile, audit_key):
+    """
+    Run one audit in this process with its default options. The profile's
+    session and clients stay cached in awsclients, so later audits for the
+    same account skip interpreter start-up, credential resolution and TLS
+    handshakes.
+    """
+    label, _ = AUDITS[audit_key]
+    start = time.monotonic()
+    try:
+        AUDIT_FUNCTIONS[audit_key](profile)
+    except botocore.exceptions.NoCredentialsError:
+        print("No credentials found. Please ensure your profile is set up correctly in .aws/config.")
+    except Exception as e:
+        # A failed audit should not end the session, as a failed subprocess did not.
+        print(f"{label} failed: {type(e).__name__}: {e}")
+    awsmetrics.print_summary_and_reset()
+    print(f"{label} finished in {time.monotonic() - start:.1f}s")
+
+def run_cell(profile, script, cell_dir, account_slots):
+    """
+    Run one audit script for one profile inside its own output directory.
+    The audits write fixed file names into the working directory, so every
+    cell gets a directory of its own. Returns (exit status, wall seconds, output paths).
+    """
+    with account_slots[profile]:
+        os.makedirs(cell_dir, exist_ok=True)
+        start = time.monotonic()
+        with open(os.path.join(cell_dir, "audit.log"), "w") as log:
+            try:
+                status = subprocess.call(["python3", os.path.join(SCRIPT_DIR, script), profile],
+                                         cwd=cell_dir, stdout=log, stderr=subprocess.STDOUT)
+            except OSError as e:
+                log.write(f"Failed to start {script}: {e}\n")
+                status = -1
+        elapsed = time.monotonic() - start
+    outputs = sorted(os.path.join(cell_dir, name) for name in os.listdir(cell_dir))
+    return status, elapsed, outputs
+
+def run_batch(account_keys, audit_keys, jobs, per_account, output_root):
+    """Run every account x audit cell on a worker pool and print a summary table."""
+    account_slots = {AWS_ACCOUNTS[key]["profile"]: threading.Semaphore(per_account) for key in account_keys}
+    # Interleave accounts so the per-account limit rarely idles a global worker.
+    cells = [(AWS_ACCOUNTS[account_key], AUDITS[audit_key])
+             for audit_key in audit_keys for account_key in account_keys]
+
+    print(f"Running {len(cells)} audits ({jobs} at a time, {per_account} per account); output in {output_root}")
+    batch_start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = []
+        for account, (label, script) in cells:
+            cell_dir = os.path.join(output_root, account["profile"], os.path.splitext(script)[0])
+            futures.append(pool.submit(run_cell, account["profile"], script, cell_dir, account_slots))
+        results = [future.result() for future in futures]
+    batch_elapsed = time.monotonic() - batch_start
+
+    print("\nBatch Audit Summary")
+    print("-------------------")
+    print(f"{'Account':<26} {'Audit':<18} {'Status':<8} {'Wall (s)':>9}  Outputs")
+    failures = 0
+    for (account, (label, script)), (status, elapsed, outputs) in zip(cells, results):
+        if status != 0:
+            status_text = f"EXIT {status}"
+        elif not any(path.endswith(".csv") for path in outputs):
+            # Every audit writes at least one CSV; exiting 0 without one is a silent failure.
+            status_text = "NO CSV"
+        else:
+            status_text = "OK"
+        failures += status_text != "OK"
+        print(f"{account['name']:<26} {label:<18} {status_text:<8} {elapsed:>9.1f}  {', '.join(os.path.relpath(p, output_root) for p in outputs)}")
+    print(f"\nCompleted {len(cells)} audits in {batch_elapsed:.1f}s, {failures} failed.")
+    return failures
+
+def parse_keys(value, choices, what):
+    if value == "all":
+        return list(choices)
+    keys = [key.strip() for key in value.split(",") if key.strip()]
+    unknown = [key for key in keys if key not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown {what} choice(s): {', '.join(unknown)}")
+    return keys
+
 # Main function
 def main():
     while True:
@@ -49,27 +167,42 @@ def main():
             print("0. Back to Account Selection")
             choice = input("Choose the option to start: ").strip()
 
-            if choice == '1':
-                print("Starting EC2 Audit...")
-                subprocess.call(["python3", "ec2auditfull.py", profile])
-            elif choice == '2':
-                print("Starting RDS Audit...")
-                subprocess.call(["python3", "rdsaudit.py", profile])
-            elif choice == '3':
-                print("Starting Security Audit...")
-                subprocess.call(["python3", "sgaudit.py", profile])
-            elif choice == '4':
-                print("Starting Monitoring Audit...")
-                subprocess.call(["python3", "cwaudit.py", profile])
-            elif choice == '5':
-                print("Starting S3 Audit...")
-                subprocess.call(["python3", "s3audit.py", profile])
+            if choice in AUDITS:
+                label, script = AUDITS[choice]
+                print(f"Starting {label}...")
+                run_in_process(profile, choice)
             elif choice == '0':
+                # Close this account's connections; the next account gets its own.
+                awsclients.clear(profile)
                 print("Returning to Account Selection...")
                 break
             else:
                 print("Invalid option. Please choose a valid option.")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Run AWS audits interactively, or all at once with --batch.")
+    parser.add_argument("--batch", action="store_true",
+                        help="run the account x audit matrix non-interactively")
+    parser.add_argument("--accounts", default="all",
+                        help="comma-separated account menu numbers for --batch (default: all)")
+    parser.add_argument("--audits", default="all",
+                        help="comma-separated audit menu numbers for --batch (default: all)")
+    parser.add_argument("--jobs", type=int, default=8, help="audits running at once across all accounts (default 8)")
+    parser.add_argument("--per-account", type=int, default=2, help="audits running at once per account (default 2)")
+    parser.add_argument("--output-dir", default=None,
+                        help="root directory for batch output (default: audit-runs/<timestamp>)")
+    args = parser.parse_args()
+
+    if not args.batch:
+        main()
+    else:
+        try:
+            account_keys = parse_keys(args.accounts, AWS_ACCOUNTS, "account")
+            audit_keys = parse_keys(args.audits, AUDITS, "audit")
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+        output_root = os.path.abspath(args.output_dir or os.path.join(
+            "audit-runs", datetime.datetime.now().strftime("%Y%m%d-%H%M%S")))
+        failures = run_batch(account_keys, audit_keys, max(args.jobs, 1), max(args.per_account, 1), output_root)
+        sys.exit(1 if failures else 0)
 
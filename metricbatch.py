@@ -0,0 +1,198 @@
+"""
+Batched CloudWatch GetMetricData for the audit scripts.
+
+Callers describe each metric they want once, keyed by anything hashable;
+fetch() packs the queries into GetMetricData calls of up to 500 queries
+each (the API's limit), pages through each call's results, and hands back
+every key's datapoints. Batches can run concurrently.
+
+With a DatapointCache, queries over a window ending at a UTC midnight
+(daily_window) are answered from disk when any earlier run that day
+already fetched them.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from invcache import cache_root
+from pagecollect import iter_pages
+
+# GetMetricData accepts at most this many queries per call.
+MAX_QUERIES_PER_CALL = 500
+
+
+def metric_query(namespace, metric_name, dimensions, stat, period):
+    """A MetricStat for fetch(); dimensions is a {name: value} dict."""
+    return {
+        "Metric": {
+            "Namespace": namespace,
+            "MetricName": metric_name,
+            "Dimensions": [{"Name": name, "Value": value} for name, value in dimensions.items()],
+        },
+        "Period": period,
+        "Stat": stat,
+    }
+
+
+def fetch_batch(cw_client, batch, start_time, end_time, stats=None):
+    """Run one GetMetricData call (all of its pages) for up to MAX_QUERIES_PER_CALL (key, query) pairs."""
+    ids = {f"q{i}": key for i, (key, _) in enumerate(batch)}
+    queries = [{"Id": query_id, "MetricStat": query, "ReturnData": True}
+               for query_id, (_, query) in zip(ids, batch)]
+    datapoints = {key: [] for key in ids.values()}
+    for page in iter_pages(cw_client, 'get_metric_data', stats, MetricDataQueries=queries,
+                           StartTime=start_time, EndTime=end_time, ScanBy='TimestampAscending'):
+        for result in page.get('MetricDataResults', []):
+            # One query's datapoints may be split across pages.
+            datapoints[ids[result['Id']]].extend(zip(result.get('Timestamps', []), result.get('Values', [])))
+    return datapoints
+
+
+class DatapointCache:
+    """
+    Per-profile, per-region store of datapoints fetched for windows ending at
+    a UTC midnight. Nothing in such a window changes once the day has begun,
+    so one file per day holds them and earlier days' files are dropped.
+    """
+
+    def __init__(self, profile_name, region, enabled=True):
+        self.profile_name = profile_name
+        self.region = region or "default"
+        self.enabled = enabled
+        self.day = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load() if enabled else {}
+        self._new = {}
+
+    @property
+    def directory(self):
+        return os.path.join(cache_root(), "metrics", self.profile_name, self.region)
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"{self.day}.json.gz")
+
+    def _load(self):
+        try:
+            for name in os.listdir(self.directory):
+                if not name.startswith(self.day):
+                    os.remove(os.path.join(self.directory, name))
+            with gzip.open(self.path, "rt") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(query, start_time, end_time):
+        text = json.dumps([query, start_time.isoformat(), end_time.isoformat()], sort_keys=True)
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def get(self, key):
+        """Cached [(timestamp, value), ...] for a key, or None."""
+        with self._lock:
+            points = self._entries.get(key) if self.enabled else None
+            if points is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return [(datetime.datetime.fromtimestamp(ts, datetime.timezone.utc), value) for ts, value in points]
+
+    def put(self, key, points):
+        if self.enabled:
+            with self._lock:
+                self._new[key] = [(ts.timestamp(), value) for ts, value in points]
+
+    def save(self):
+        """Write new entries, merged with whatever other runs saved today."""
+        with self._lock:
+            if not self._new:
+                return
+            entries = self._load()
+            entries.update(self._new)
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, "wt") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._entries = entries
+            self._new = {}
+
+    def invalidate(self):
+        """Forget today's datapoints, cached and pending."""
+        with self._lock:
+            self._entries = {}
+            self._new = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def print_stats(self):
+        print(f"Metric cache ({self.profile_name}/{self.region}): {self.hits} hits, {self.misses} misses")
+
+
+def fetch(cw_client, queries, start_time, end_time, workers=1, stats=None, cache=None):
+    """
+    Fetch datapoints for many metrics in as few calls as possible.
+    `queries` maps a caller key to a metric_query(); returns
+    {key: [(timestamp, value), ...]} in ascending time order.
+    Only pass a DatapointCache for windows from daily_window(), and save()
+    it once done; fetched datapoints are held in memory until then.
+    """
+    datapoints = {}
+    cache_keys = {}
+    items = []
+    for key, query in queries.items():
+        if cache is not None:
+            cache_keys[key] = cache.key(query, start_time, end_time)
+            points = cache.get(cache_keys[key])
+            if points is not None:
+                datapoints[key] = points
+                continue
+        items.append((key, query))
+    batches = [items[i:i + MAX_QUERIES_PER_CALL] for i in range(0, len(items), MAX_QUERIES_PER_CALL)]
+    if not batches:
+        return datapoints
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        for result in pool.map(lambda batch: fetch_batch(cw_client, batch, start_time, end_time, stats), batches):
+            for key, points in result.items():
+                points.sort()
+                datapoints[key] = points
+                if cache is not None:
+                    cache.put(cache_keys[key], points)
+    return datapoints
+
+
+def common_day_values(series):
+    """
+    {name: value} for several datapoint lists read at one timestamp: the most
+    recent one every list with data has, or failing that the most recent of
+    all, where lists without a datapoint there are left out.
+    """
+    timestamps = [{ts for ts, _ in points} for points in series.values() if points]
+    if not timestamps:
+        return {}
+    common = set.intersection(*timestamps)
+    when = max(common) if common else max(max(stamps) for stamps in timestamps)
+    values = {}
+    for name, points in series.items():
+        for ts, value in points:
+            if ts == when:
+                values[name] = value
+    return values
+
+
+def window(days, end_time=None):
+    """(start, end) covering the last `days` days, ending now by default."""
+    end_time = end_time or datetime.datetime.now(datetime.timezone.utc)
+    return end_time - datetime.timedelta(days=days), end_time
+
+
+def daily_window(days):
+    """(start, end) covering the last `days` whole days, ending at the most recent UTC midnight."""
+    end_time = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return window(days, end_time)
@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Per-thread pointer to the PageStats being filled by the page fetcher running
+# on that thread, so the after-call hook knows which family to charge.
+_local = threading.local()
+
+# Sentinel pushed by the fetcher once the paginator is exhausted.
+_DONE = object()
+
+
+class PageStats:
+    """Page count, bytes received and wall time for one resource family."""
+
+    def __init__(self, family):
+        self.family = family
+        self.pages = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+
+class _FetchError:
+    def __init__(self, error):
+        self.error = error
+
+
+def _count_response_bytes(http_response=None, **kwargs):
+    """botocore after-call hook: add the raw response size to the active family."""
+    stats = getattr(_local, "stats", None)
+    if stats is not None and http_response is not None:
+        stats.bytes += len(http_response.content or b"")
+
+
+def iter_pages(client, operation, stats=None, prefetch=1, **kwargs):
+    """
+    Yield every page of a paginated describe call.
+    Pages are fetched on a background thread that stays up to `prefetch`
+    pages ahead, so page N+1 is on the wire while page N is being processed.
+    """
+    if stats is None:
+        stats = PageStats(operation)
+    client.meta.events.register("after-call", _count_response_bytes,
+                                unique_id="pagecollect-response-bytes")
+    pages = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        # Block until the consumer makes room, unless it has gone away.
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch():
+        _local.stats = stats
+        try:
+            for page in client.get_paginator(operation).paginate(**kwargs):
+                stats.pages += 1
+                if not put(page):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(_FetchError(e))
+        finally:
+            _local.stats = None
+
+    fetcher = threading.Thread(target=fetch, name=f"pages-{operation}", daemon=True)
+    fetcher.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _FetchError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        fetcher.join()
+
+
+def collect_families(families):
+    """
+    Run several resource-family collectors concurrently.
+    `families` maps a family name to a callable taking a PageStats; returns
+    (results, stats) where both are dicts keyed by family name.
+    """
+    stats = {name: PageStats(name) for name in families}
+
+    def run(name):
+        start = time.monotonic()
+        try:
+            return families[name](stats[name])
+        finally:
+            stats[name].seconds = time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=max(len(families), 1)) as pool:
+        futures = {name: pool.submit(run, name) for name in families}
+        results = {name: future.result() for name, future in futures.items()}
+    return results, stats
+
+
+def print_page_stats(stats, region=None):
+    """Print the per-family page count and bytes received."""
+    print(f"Collection summary ({region}):" if region else "Collection summary:")
+    print(f"  {'Family':<12} {'Pages':>7} {'Bytes':>14} {'Seconds':>9}")
+    for s in stats.values():
+        print(f"  {s.family:<12} {s.pages:>7} {s.bytes:>14,} {s.seconds:>9.2f}")
@@ -1,9 +1,14 @@
-import boto3
+import argparse
 import botocore
 import datetime
 import csv
 import sys
 
+import auditsink
+import invcache
+from regionfanout import add_region_arguments, fan_out, print_region_timings, regional_clients, resolve_regions
+from streamcsv import StreamOutput, add_stream_arguments, batched
+
 def get_age_from_dt(dt):
     """
     Given a datetime object, compute a human-friendly age.
@@ -24,115 +29,195 @@ def get_age_from_dt(dt):
         years = days // 365
         return f"{years} years old"
 
-def audit_rds_resources(profile_name):
-    session = boto3.Session(profile_name=profile_name)
-    rds_client = session.client('rds')
-
-    # ----------------------- RDS DB Instances ---------------------------
-    response = rds_client.describe_db_instances()
-    rds_instances = []
-
-    for db in response['DBInstances']:
-        db_id = db.get('DBInstanceIdentifier', 'N/A')
-        db_class = db.get('DBInstanceClass', 'N/A')
-        engine = db.get('Engine', 'N/A')
-        engine_version = db.get('EngineVersion', 'N/A')
-        status = db.get('DBInstanceStatus', 'N/A')
-        master = db.get('MasterUsername', 'N/A')
-        az = db.get('AvailabilityZone', 'N/A')
-        backup_retention = db.get('BackupRetentionPeriod', 'N/A')
-        multi_az = db.get('MultiAZ', 'N/A')
-        created_time = db.get('InstanceCreateTime')
-        age = get_age_from_dt(created_time) if created_time else "Unknown"
-
-        rds_instances.append({
-            "DBInstanceIdentifier": db_id,
-            "DBInstanceClass": db_class,
-            "Engine": engine,
-            "EngineVersion": engine_version,
-            "Status": status,
-            "MasterUsername": master,
-            "AvailabilityZone": az,
-            "BackupRetentionPeriod": backup_retention,
-            "MultiAZ": multi_az,
-            "Age": age
-        })
-
-    # Save RDS Instances audit to CSV with total count at the top
-    with open('rds_instances.csv', 'w', newline='') as f_rds:
-        writer = csv.writer(f_rds)
-        writer.writerow([f"Total RDS Instances: {len(rds_instances)}"])
-        writer.writerow([
-            "DB Instance Identifier", "DB Instance Class", "Engine",
-            "Engine Version", "Status", "Master Username",
-            "Availability Zone", "Backup Retention Period", "MultiAZ", "Age"
-        ])
-        for db in rds_instances:
-            writer.writerow([
-                db["DBInstanceIdentifier"],
-                db["DBInstanceClass"],
-                db["Engine"],
-                db["EngineVersion"],
-                db["Status"],
-                db["MasterUsername"],
-                db["AvailabilityZone"],
-                db["BackupRetentionPeriod"],
-                db["MultiAZ"],
-                db["Age"]
-            ])
-
-    # ----------------------- RDS Snapshots ---------------------------
-    snapshot_response = rds_client.describe_db_snapshots()
-    rds_snapshots = []
-    for snapshot in snapshot_response['DBSnapshots']:
-        snapshot_id = snapshot.get('DBSnapshotIdentifier', 'N/A')
-        attached_rds = snapshot.get('DBInstanceIdentifier', 'N/A')
-        snapshot_create_time = snapshot.get('SnapshotCreateTime')
-        age = get_age_from_dt(snapshot_create_time) if snapshot_create_time else "Unknown"
-        snapshot_type = snapshot.get('SnapshotType', 'N/A')  # "manual" or "automated"
-        # Try to get a "CreatedBy" tag from TagList if present
-        created_by = "N/A"
-        if 'TagList' in snapshot:
-            created_by = next((tag.get('Value')
-                               for tag in snapshot.get('TagList', [])
-                               if tag.get('Key', '').lower() == 'createdby'), "N/A")
-        rds_snapshots.append({
-            "SnapshotID": snapshot_id,
-            "AttachedRDS": attached_rds,
-            "Age": age,
-            "CreatedBy": created_by,
-            "SnapshotType": snapshot_type,
-            "SnapshotCreateTime": snapshot_create_time  # for sorting purposes
-        })
-
-    # Sort RDS snapshots with the newest first
-    rds_snapshots = sorted(rds_snapshots, key=lambda x: x["SnapshotCreateTime"], reverse=True)
-
-    # Save RDS Snapshots audit to CSV with total count at the top
-    with open('rds_snapshots.csv', 'w', newline='') as f_snap:
-        writer = csv.writer(f_snap)
-        writer.writerow([f"Total RDS Snapshots: {len(rds_snapshots)}"])
-        writer.writerow(["Snapshot ID", "Attached RDS", "Age (newest first)", "Created by", "Type (manual/awsgenerated)"])
-        for snap in rds_snapshots:
-            writer.writerow([
-                snap["SnapshotID"],
-                snap["AttachedRDS"],
-                snap["Age"],
-                snap["CreatedBy"],
-                snap["SnapshotType"]
-            ])
+def iter_db_instances(rds_client, cache, region):
+    for page in cache.pages(rds_client, 'describe_db_instances'):
+        for db in page['DBInstances']:
+            db_id = db.get('DBInstanceIdentifier', 'N/A')
+            db_class = db.get('DBInstanceClass', 'N/A')
+            engine = db.get('Engine', 'N/A')
+            engine_version = db.get('EngineVersion', 'N/A')
+            status = db.get('DBInstanceStatus', 'N/A')
+            master = db.get('MasterUsername', 'N/A')
+            az = db.get('AvailabilityZone', 'N/A')
+            backup_retention = db.get('BackupRetentionPeriod', 'N/A')
+            multi_az = db.get('MultiAZ', 'N/A')
+            created_time = db.get('InstanceCreateTime')
+            age = get_age_from_dt(created_time) if created_time else "Unknown"
+
+            yield {
+                "DBInstanceIdentifier": db_id,
+                "DBInstanceClass": db_class,
+                "Engine": engine,
+                "EngineVersion": engine_version,
+                "Status": status,
+                "MasterUsername": master,
+                "AvailabilityZone": az,
+                "BackupRetentionPeriod": backup_retention,
+                "MultiAZ": multi_az,
+                "Age": age,
+                "Region": region
+            }
+
+def collect_db_instances(rds_client, cache, region):
+    return list(iter_db_instances(rds_client, cache, region))
+
+def iter_db_snapshots(rds_client, cache, region):
+    for page in cache.pages(rds_client, 'describe_db_snapshots'):
+        for snapshot in page['DBSnapshots']:
+            snapshot_id = snapshot.get('DBSnapshotIdentifier', 'N/A')
+            attached_rds = snapshot.get('DBInstanceIdentifier', 'N/A')
+            snapshot_create_time = snapshot.get('SnapshotCreateTime')
+            age = get_age_from_dt(snapshot_create_time) if snapshot_create_time else "Unknown"
+            snapshot_type = snapshot.get('SnapshotType', 'N/A')  # "manual" or "automated"
+            # Try to get a "CreatedBy" tag from TagList if present
+            created_by = "N/A"
+            if 'TagList' in snapshot:
+                created_by = next((tag.get('Value')
+                                   for tag in snapshot.get('TagList', [])
+                                   if tag.get('Key', '').lower() == 'createdby'), "N/A")
+            yield {
+                "SnapshotID": snapshot_id,
+                "AttachedRDS": attached_rds,
+                "Age": age,
+                "CreatedBy": created_by,
+                "SnapshotType": snapshot_type,
+                "SnapshotCreateTime": snapshot_create_time,  # for sorting purposes
+                "Region": region
+            }
+
+def collect_db_snapshots(rds_client, cache, region):
+    return list(iter_db_snapshots(rds_client, cache, region))
+
+# record type -> (indexed id column, {column: row key}) for the audit sink.
+SINK_RECORDS = {
+    "rds_instances": ("db_instance_identifier", {
+        "db_instance_identifier": "DBInstanceIdentifier", "db_instance_class": "DBInstanceClass",
+        "engine": "Engine", "engine_version": "EngineVersion", "status": "Status",
+        "master_username": "MasterUsername", "availability_zone": "AvailabilityZone",
+        "backup_retention_period": "BackupRetentionPeriod", "multi_az": "MultiAZ", "age": "Age",
+        "region": "Region"}),
+    "rds_snapshots": ("snapshot_id", {
+        "snapshot_id": "SnapshotID", "db_instance_identifier": "AttachedRDS", "snapshot_type": "SnapshotType",
+        "snapshot_create_time": "SnapshotCreateTime", "age": "Age", "created_by": "CreatedBy",
+        "region": "Region"}),
+}
+
+# record type -> (CSV file, classic summary label, header, row function) for both output layouts.
+CSV_TABLES = {
+    "rds_instances": ("rds_instances.csv", "Total RDS Instances", [
+        "DB Instance Identifier", "DB Instance Class", "Engine",
+        "Engine Version", "Status", "Master Username",
+        "Availability Zone", "Backup Retention Period", "MultiAZ", "Age", "Region"
+    ], lambda db: [
+        db["DBInstanceIdentifier"],
+        db["DBInstanceClass"],
+        db["Engine"],
+        db["EngineVersion"],
+        db["Status"],
+        db["MasterUsername"],
+        db["AvailabilityZone"],
+        db["BackupRetentionPeriod"],
+        db["MultiAZ"],
+        db["Age"],
+        db["Region"]
+    ]),
+    "rds_snapshots": ("rds_snapshots.csv", "Total RDS Snapshots", [
+        "Snapshot ID", "Attached RDS", "Age (newest first)", "Created by", "Type (manual/awsgenerated)", "Region"
+    ], lambda snap: [
+        snap["SnapshotID"],
+        snap["AttachedRDS"],
+        snap["Age"],
+        snap["CreatedBy"],
+        snap["SnapshotType"],
+        snap["Region"]
+    ]),
+}
+
+def stream_records(items, record_type, streams, sink):
+    """Write rows to their CSV and the sink a batch at a time, without keeping them."""
+    _, _, _, row = CSV_TABLES[record_type]
+    key, fields = SINK_RECORDS[record_type]
+    for batch in batched(items):
+        for item in batch:
+            streams.files[record_type].write(row(item))
+        sink.write(record_type, batch, fields, key)
+
+def audit_rds_resources(profile_name, regions=None, cache_ttl=invcache.DEFAULT_TTL, refresh_cache=False,
+                        sqlite_path=None, stream=False):
+    sink = auditsink.open_sink(profile_name, "rdsaudit", sqlite_path)
+    region_names = resolve_regions(profile_name, regions)
+    rds_clients = regional_clients(profile_name, 'rds', region_names)
+    caches = {region: invcache.open_cache(profile_name, region, cache_ttl, refresh_cache) for region in region_names}
+
+    if stream:
+        # Rows go to disk as each page arrives; counts go to the manifest.
+        streams = StreamOutput("rds_audit.manifest.json")
+        for record_type, (path, _, header, _) in CSV_TABLES.items():
+            streams.open(record_type, path, header)
+
+        def stream_region(region):
+            stream_records(iter_db_instances(rds_clients[region], caches[region], region),
+                           "rds_instances", streams, sink)
+            stream_records(iter_db_snapshots(rds_clients[region], caches[region], region),
+                           "rds_snapshots", streams, sink)
+
+        _, region_timings = fan_out(region_names, stream_region)
+        counts = {record_type: streams.files[record_type].rows for record_type in CSV_TABLES}
+        streams.close({label: counts[record_type] for record_type, (_, label, _, _) in CSV_TABLES.items()})
+        sink.close({"instances": counts["rds_instances"], "snapshots": counts["rds_snapshots"]})
+    else:
+        def collect_region(region):
+            return (collect_db_instances(rds_clients[region], caches[region], region),
+                    collect_db_snapshots(rds_clients[region], caches[region], region))
+
+        region_results, region_timings = fan_out(region_names, collect_region)
+
+        # ----------------------- RDS DB Instances ---------------------------
+        rds_instances = [db for instances, _ in region_results.values() for db in instances]
+
+        # ----------------------- RDS Snapshots ---------------------------
+        rds_snapshots = [snap for _, snapshots in region_results.values() for snap in snapshots]
+
+        # Sort RDS snapshots with the newest first
+        rds_snapshots = sorted(rds_snapshots, key=lambda x: x["SnapshotCreateTime"], reverse=True)
+
+        # Save each audit to CSV with total count at the top
+        for record_type, rows in (("rds_instances", rds_instances), ("rds_snapshots", rds_snapshots)):
+            path, label, header, row = CSV_TABLES[record_type]
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow([f"{label}: {len(rows)}"])
+                writer.writerow(header)
+                for item in rows:
+                    writer.writerow(row(item))
+
+        for record_type, rows in (("rds_instances", rds_instances), ("rds_snapshots", rds_snapshots)):
+            key, fields = SINK_RECORDS[record_type]
+            sink.write(record_type, rows, fields, key)
+        sink.close({"instances": len(rds_instances), "snapshots": len(rds_snapshots)})
 
     print("RDS audit completed. Output saved to:")
     print("  rds_instances.csv")
     print("  rds_snapshots.csv")
+    if stream:
+        print("  rds_audit.manifest.json")
+    for cache in caches.values():
+        cache.print_stats()
+    print_region_timings(region_timings)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 rdsaudit.py <AWS_PROFILE>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Audit RDS instances and snapshots.")
+    parser.add_argument("profile", help="AWS profile to audit")
+    add_region_arguments(parser)
+    invcache.add_cache_arguments(parser)
+    auditsink.add_sink_arguments(parser)
+    add_stream_arguments(parser)
+    args = parser.parse_args()
 
-    PROFILE_NAME = sys.argv[1]  # Get the profile name from the command-line argument
+    PROFILE_NAME = args.profile  # Get the profile name from the command-line argument
     try:
-        audit_rds_resources(PROFILE_NAME)
+        audit_rds_resources(PROFILE_NAME, regions=args.regions, cache_ttl=args.cache_ttl, refresh_cache=args.refresh_cache,
+                            sqlite_path=args.sqlite, stream=args.stream)
     except botocore.exceptions.NoCredentialsError:
         print("No credentials found. Please ensure your profile is set up correctly in .aws/config.")
+        sys.exit(1)
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import awsclients
+from invcache import cache_root
+
+# Enabled regions change rarely; rediscover them once a day.
+REGION_CACHE_TTL = 24 * 3600
+
+_discovered = {}
+_discover_lock = threading.Lock()
+
+
+def discover_regions(profile_name):
+    """
+    Return the regions enabled for the profile's account.
+    Looked up once per process and cached on disk for REGION_CACHE_TTL.
+    """
+    with _discover_lock:
+        if profile_name in _discovered:
+            return _discovered[profile_name]
+        path = os.path.join(cache_root(), "regions", f"{profile_name}.json")
+        try:
+            if time.time() - os.path.getmtime(path) < REGION_CACHE_TTL:
+                with open(path) as f:
+                    _discovered[profile_name] = json.load(f)
+                return _discovered[profile_name]
+        except (OSError, ValueError):
+            pass
+
+        # Without AllRegions, only regions the account has enabled are returned.
+        response = awsclients.get_client(profile_name, 'ec2').describe_regions()
+        regions = sorted(region['RegionName'] for region in response['Regions'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(regions, f)
+        _discovered[profile_name] = regions
+        return regions
+
+
+def resolve_regions(profile_name, spec=None):
+    """
+    Turn a --regions value into a list of region names.
+    None means the profile's default region, "all" means every enabled region.
+    """
+    if not spec:
+        return [awsclients.default_region(profile_name)]
+    if spec == "all":
+        return discover_regions(profile_name)
+    return [region.strip() for region in spec.split(",") if region.strip()]
+
+
+def regional_clients(profile_name, service, regions, concurrency=None):
+    return {region: awsclients.get_client(profile_name, service, region, concurrency) for region in regions}
+
+
+def fan_out(regions, collect):
+    """
+    Call collect(region) for every region concurrently.
+    Returns (results, timings): dicts keyed by region, in the order given.
+    """
+    timings = {}
+
+    def run(region):
+        start = time.monotonic()
+        try:
+            return collect(region)
+        finally:
+            timings[region] = time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=max(len(regions), 1)) as pool:
+        futures = {region: pool.submit(run, region) for region in regions}
+        results = {region: future.result() for region, future in futures.items()}
+    return results, {region: timings[region] for region in regions}
+
+
+def print_region_timings(timings):
+    """Print per-region wall time, slowest first."""
+    print("Per-region wall time:")
+    for region, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        print(f"  {region:<16} {seconds:>8.2f}s")
+
+
+def add_region_arguments(parser):
+    parser.add_argument("--regions", default=None,
+                        help="comma-separated regions, or 'all' for every enabled region "
+                             "(default: the profile's region)")
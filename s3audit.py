@@ -1,17 +1,306 @@
-import boto3
+import argparse
 import botocore
 import csv
+import json
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def audit_s3_buckets(profile_name):
-    # Start the session using the provided AWS profile
-    session = boto3.Session(profile_name=profile_name)
-    s3_client = session.client('s3')
+import auditsink
+import awsclients
+import configbackend
+import invcache
+import metricbatch
+from regionfanout import add_region_arguments, fan_out, print_region_timings, resolve_regions
+from streamcsv import StreamOutput, add_stream_arguments
 
-    # List all S3 buckets
-    buckets_response = s3_client.list_buckets()
-    buckets = buckets_response.get("Buckets", [])
+DEFAULT_WORKERS = 32
+# A bucket's region only changes if it is deleted and recreated, so resolved
+# regions are kept for a week.
+BUCKET_REGION_TTL = 7 * 24 * 3600
+# Every StorageType of S3's daily BucketSizeBytes metric for general purpose
+# buckets, including the archive tiers and the per-object overheads they bill,
+# so Size (Bytes) is the bucket's whole footprint. NumberOfObjects is only
+# reported for all types together.
+STORAGE_TYPES = ("StandardStorage", "ReducedRedundancyStorage",
+                 "IntelligentTieringFAStorage", "IntelligentTieringIAStorage", "IntelligentTieringAIAStorage",
+                 "IntelligentTieringAAStorage", "IntelligentTieringDAAStorage",
+                 "IntAAObjectOverhead", "IntAAS3ObjectOverhead", "IntDAAObjectOverhead", "IntDAAS3ObjectOverhead",
+                 "StandardIAStorage", "StandardIASizeOverhead", "OneZoneIAStorage", "OneZoneIASizeOverhead",
+                 "GlacierInstantRetrievalStorage", "GlacierInstantRetrievalSizeOverhead",
+                 "GlacierStorage", "GlacierStagingStorage", "GlacierObjectOverhead", "GlacierS3ObjectOverhead",
+                 "DeepArchiveStorage", "DeepArchiveStagingStorage", "DeepArchiveObjectOverhead",
+                 "DeepArchiveS3ObjectOverhead")
+# Storage metrics are published once a day, up to a day late.
+STORAGE_METRICS_DAYS = 3
+
+def probe_versioning(s3_client, bucket_name):
+    try:
+        versioning_response = s3_client.get_bucket_versioning(Bucket=bucket_name)
+        return versioning_response.get("Status", "Disabled")
+    except botocore.exceptions.ClientError:
+        return "Error"
+
+def probe_logging(s3_client, bucket_name):
+    try:
+        logging_response = s3_client.get_bucket_logging(Bucket=bucket_name)
+        if "LoggingEnabled" in logging_response:
+            return "Enabled"
+        return "Disabled"
+    except botocore.exceptions.ClientError:
+        return "Error"
+
+def pick_lifecycle_rule(lifecycle_rules):
+    """Returns (rule name, rule status), preferring the first enabled rule."""
+    if lifecycle_rules:
+        enabled_rule = None
+        for rule in lifecycle_rules:
+            if rule.get("Status", "Disabled") == "Enabled":
+                enabled_rule = rule
+                break
+        if enabled_rule:
+            return enabled_rule.get("ID", "Unnamed"), enabled_rule.get("Status", "Disabled")
+        return lifecycle_rules[0].get("ID", "Unnamed"), lifecycle_rules[0].get("Status", "Disabled")
+    return "Not Configured", "Not Configured"
+
+def probe_lifecycle(s3_client, bucket_name):
+    """Returns (rule name, rule status), preferring the first enabled rule."""
+    try:
+        lifecycle_response = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name)
+        return pick_lifecycle_rule(lifecycle_response.get("Rules", []))
+    except botocore.exceptions.ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code", "")
+        if error_code == "NoSuchLifecycleConfiguration":
+            return "Not Configured", "Not Configured"
+        return "Error", "Error"
+
+def probe_buckets(s3_client, bucket_names, workers):
+    """
+    Run the three per-bucket probes for many buckets at once on a bounded pool.
+    Yields (bucket_name, versioning, logging, (rule name, rule status)) in
+    the order of bucket_names, regardless of completion order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = [
+            (bucket_name,
+             pool.submit(probe_versioning, s3_client, bucket_name),
+             pool.submit(probe_logging, s3_client, bucket_name),
+             pool.submit(probe_lifecycle, s3_client, bucket_name))
+            for bucket_name in bucket_names
+        ]
+        for bucket_name, versioning, logging, lifecycle in pending:
+            yield bucket_name, versioning.result(), logging.result(), lifecycle.result()
+
+def bucket_results(s3_client, bucket_names, workers, config_settings):
+    """
+    Like probe_buckets, but buckets AWS Config has settings for are answered
+    from those instead of being probed.
+    """
+    probed = probe_buckets(s3_client, [name for name in bucket_names if name not in config_settings], workers)
+    for bucket_name in bucket_names:
+        if bucket_name in config_settings:
+            versioning_status, logging_status, lifecycle_rules = config_settings[bucket_name]
+            yield bucket_name, versioning_status, logging_status, pick_lifecycle_rule(lifecycle_rules)
+        else:
+            yield next(probed)
+
+def config_bucket_settings(profile_name, regions, aggregator=None):
+    """Bucket settings recorded by AWS Config in the given regions: one paginated query per region."""
+    def query(region):
+        # Config answers are always fresh here: s3audit has no inventory cache options.
+        backend = configbackend.open_backend(profile_name, region, invcache.InventoryCache(profile_name, region, 0),
+                                             "config", aggregator)
+        return backend.bucket_settings()
+
+    results, _ = fan_out(list(regions), query)
+    settings = {}
+    for region_settings in results.values():
+        settings.update(region_settings)
+    return settings
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "PiB"
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+def storage_footprint(cw_client, bucket_names):
+    """
+    {bucket name: (storage class summary, total bytes, object count)} from the
+    daily S3 storage metrics, fetched in batched GetMetricData calls. The
+    client must be in the buckets' region; buckets without metrics get "N/A".
+    """
+    queries = {}
+    for bucket_name in bucket_names:
+        for storage_type in STORAGE_TYPES:
+            queries[bucket_name, storage_type] = metricbatch.metric_query(
+                "AWS/S3", "BucketSizeBytes", {"BucketName": bucket_name, "StorageType": storage_type},
+                "Average", 86400)
+        queries[bucket_name, "NumberOfObjects"] = metricbatch.metric_query(
+            "AWS/S3", "NumberOfObjects", {"BucketName": bucket_name, "StorageType": "AllStorageTypes"},
+            "Average", 86400)
+    start_time, end_time = metricbatch.window(STORAGE_METRICS_DAYS)
+    try:
+        datapoints = metricbatch.fetch(cw_client, queries, start_time, end_time)
+    except botocore.exceptions.ClientError:
+        return {bucket_name: ("Error", "Error", "Error") for bucket_name in bucket_names}
+
+    footprint = {}
+    for bucket_name in bucket_names:
+        # Types are published separately, so read them all from one day.
+        values = metricbatch.common_day_values(
+            {storage_type: datapoints[bucket_name, storage_type]
+             for storage_type in (*STORAGE_TYPES, "NumberOfObjects")})
+        objects = values.pop("NumberOfObjects", None)
+        sizes = sorted(((size, storage_type) for storage_type, size in values.items() if size), reverse=True)
+        footprint[bucket_name] = (
+            "; ".join(f"{storage_type} ({format_bytes(size)})" for size, storage_type in sizes) or "N/A",
+            int(sum(size for size, _ in sizes)) if sizes else "N/A",
+            int(objects) if objects is not None else "N/A",
+        )
+    return footprint
+
+def bucket_regions_path(profile_name):
+    return os.path.join(invcache.cache_root(), "s3", f"{profile_name}-bucket-regions.json")
+
+def load_bucket_regions(profile_name):
+    """
+    Bucket name -> [region, resolved-at epoch seconds] from earlier runs,
+    leaving out entries resolved more than BUCKET_REGION_TTL ago.
+    """
+    path = bucket_regions_path(profile_name)
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    # Entries written before each carried its own timestamp are plain strings and are dropped.
+    return {name: entry for name, entry in entries.items()
+            if isinstance(entry, list) and len(entry) == 2 and now - entry[1] < BUCKET_REGION_TTL}
+
+def save_bucket_regions(profile_name, known_regions):
+    path = bucket_regions_path(profile_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(known_regions, f)
+    os.replace(tmp_path, path)
+
+def bucket_region(s3_client, bucket, known_regions=None):
+    """
+    Region of a list_buckets entry: from the listing, else from earlier runs,
+    else from GetBucketLocation.
+    """
+    if bucket.get("BucketRegion"):
+        return bucket["BucketRegion"]
+    if known_regions and bucket["Name"] in known_regions:
+        return known_regions[bucket["Name"]][0]
+    try:
+        location = s3_client.get_bucket_location(Bucket=bucket["Name"]).get("LocationConstraint")
+    except botocore.exceptions.ClientError:
+        return "N/A"
+    # Buckets in us-east-1 report no constraint; very old eu-west-1 buckets report "EU".
+    return {None: "us-east-1", "": "us-east-1", "EU": "eu-west-1"}.get(location, location)
+
+# Columns of the s3_buckets record type in the audit sink; rows are keyed by column name.
+SINK_COLUMNS = {column: column for column in ("bucket_name", "storage_class", "size_bytes", "object_count",
+                                              "versioning", "logging", "lifecycle_rule_name",
+                                              "lifecycle_rule_status", "region")}
+
+CSV_HEADER = ["Bucket Name", "Storage Class", "Versioning", "Server Access Logging",
+              "Lifecycle Rule Name", "Lifecycle Rule Status", "Region", "Size (Bytes)", "Object Count"]
+
+NO_FOOTPRINT = ("N/A", "N/A", "N/A")
+
+def group_buckets(s3_client, buckets, region_names, default_region, workers, known_regions):
+    """
+    Resolve every bucket's region (recording newly resolved ones in known_regions) and group the
+    buckets by it, so each is probed through a client in its own region. With
+    region_names, only buckets in those regions are kept. Buckets whose region
+    cannot be resolved are probed from default_region.
+    Returns (buckets kept, with BucketRegion set, {region: [bucket names]}).
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        locations = list(pool.map(lambda bucket: bucket_region(s3_client, bucket, known_regions), buckets))
+    buckets = [dict(bucket, BucketRegion=location) for bucket, location in zip(buckets, locations)
+               if not region_names or location in region_names]
+    bucket_groups = {}
+    for bucket in buckets:
+        known = known_regions.get(bucket["Name"])
+        # Entries keep the time they were first resolved, so each one expires on its own.
+        if bucket["BucketRegion"] != "N/A" and (known is None or known[0] != bucket["BucketRegion"]):
+            known_regions[bucket["Name"]] = [bucket["BucketRegion"], time.time()]
+        probe_region = default_region if bucket["BucketRegion"] == "N/A" else bucket["BucketRegion"]
+        bucket_groups.setdefault(probe_region, []).append(bucket["Name"])
+    return buckets, bucket_groups
+
+def audit_s3_buckets(profile_name, regions=None, workers=DEFAULT_WORKERS, sqlite_path=None, stream=False,
+                     backend=configbackend.DEFAULT_BACKEND, config_aggregator=None, storage_metrics=True):
+    sink = auditsink.open_sink(profile_name, "s3audit", sqlite_path)
+    s3_client = awsclients.get_client(profile_name, 's3', concurrency=workers)
+    # With --regions, only buckets in those regions are audited.
+    region_names = resolve_regions(profile_name, regions) if regions else None
+    default_region = awsclients.default_region(profile_name)
+    known_regions = load_bucket_regions(profile_name)
+    known_before = dict(known_regions)
+
+    def probe_client(region):
+        # Each region is probed through its own pooled client, `workers` probes
+        # at a time, so no call is redirected from another region. One
+        # connection per worker keeps probes from queueing for a connection.
+        return awsclients.get_client(profile_name, 's3', region, concurrency=workers)
+
+    def region_footprint(region, bucket_names):
+        # Storage metrics live in CloudWatch in the bucket's own region.
+        if not storage_metrics:
+            return {}
+        return storage_footprint(awsclients.get_client(profile_name, 'cloudwatch', region), bucket_names)
+
+    # List all S3 buckets; paginated listings also report each bucket's region.
+    listing = s3_client.get_paginator('list_buckets').paginate(PaginationConfig={'PageSize': 1000})
+
+    # With the Config backend, buckets Config has recorded are not probed; see bucket_results.
+    config_settings = {}
+    loaded_config_regions = set()
+
+    def load_config_settings(bucket_regions):
+        if backend == "config":
+            missing = sorted(set(bucket_regions) - loaded_config_regions - {"N/A"})
+            config_settings.update(config_bucket_settings(profile_name, missing, config_aggregator))
+            loaded_config_regions.update(missing)
+
+    if stream:
+        audit_s3_stream(listing, s3_client, probe_client, region_footprint, region_names, default_region, workers,
+                        sink, config_settings, load_config_settings, known_regions)
+        if known_regions != known_before:
+            save_bucket_regions(profile_name, known_regions)
+        return
+
+    buckets = []
+    for page in listing:
+        buckets.extend(page.get("Buckets", []))
+    buckets, bucket_groups = group_buckets(s3_client, buckets, region_names, default_region, workers, known_regions)
+    if known_regions != known_before:
+        save_bucket_regions(profile_name, known_regions)
     total_buckets = len(buckets)
+    load_config_settings(bucket.get("BucketRegion", "N/A") for bucket in buckets)
+
+    def probe_region(region):
+        results = {result[0]: result[1:]
+                   for result in bucket_results(probe_client(region), bucket_groups[region], workers, config_settings)}
+        return results, region_footprint(region, bucket_groups[region])
+
+    region_results, region_timings = fan_out(list(bucket_groups), probe_region)
+    probe_results = {}
+    footprints = {}
+    for results, footprint in region_results.values():
+        probe_results.update(results)
+        footprints.update(footprint)
 
     # Prepare lists for summary information
     access_logging_enabled_buckets = []
@@ -25,68 +314,18 @@ def audit_s3_buckets(profile_name):
         # Write summary row at the very top: total buckets audited
         writer.writerow([f"Total Buckets Audited: {total_buckets}"])
         # Write CSV header for per-bucket details
-        writer.writerow(["Bucket Name", "Storage Class", "Versioning", "Server Access Logging", 
-                         "Lifecycle Rule Name", "Lifecycle Rule Status"])
+        writer.writerow(CSV_HEADER)
 
-        # Iterate over each bucket
         for bucket in buckets:
             bucket_name = bucket.get("Name", "N/A")
-            
-            # Set default values for bucket-level settings
-            storage_class = "N/A"  # Buckets do not have a bucket-wide storage class.
-            versioning_status = "Disabled"
-            logging_status = "Disabled"
-            lifecycle_rule_name = "Not Configured"
-            lifecycle_rule_status = "Not Configured"
-
-            # Fetch versioning status
-            try:
-                versioning_response = s3_client.get_bucket_versioning(Bucket=bucket_name)
-                versioning_status = versioning_response.get("Status", "Disabled")
-            except botocore.exceptions.ClientError:
-                versioning_status = "Error"
-
-            # Fetch server access logging configuration
-            try:
-                logging_response = s3_client.get_bucket_logging(Bucket=bucket_name)
-                if "LoggingEnabled" in logging_response:
-                    logging_status = "Enabled"
-                else:
-                    logging_status = "Disabled"
-            except botocore.exceptions.ClientError:
-                logging_status = "Error"
-
-            # Fetch lifecycle configuration and check for an enabled rule
-            try:
-                lifecycle_response = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket_name)
-                lifecycle_rules = lifecycle_response.get("Rules", [])
-                if lifecycle_rules:
-                    enabled_rule = None
-                    for rule in lifecycle_rules:
-                        if rule.get("Status", "Disabled") == "Enabled":
-                            enabled_rule = rule
-                            break
-                    if enabled_rule:
-                        lifecycle_rule_name = enabled_rule.get("ID", "Unnamed")
-                        lifecycle_rule_status = enabled_rule.get("Status", "Disabled")
-                    else:
-                        lifecycle_rule_name = lifecycle_rules[0].get("ID", "Unnamed")
-                        lifecycle_rule_status = lifecycle_rules[0].get("Status", "Disabled")
-                else:
-                    lifecycle_rule_name = "Not Configured"
-                    lifecycle_rule_status = "Not Configured"
-            except botocore.exceptions.ClientError as e:
-                error_code = e.response.get("Error", {}).get("Code", "")
-                if error_code == "NoSuchLifecycleConfiguration":
-                    lifecycle_rule_name = "Not Configured"
-                    lifecycle_rule_status = "Not Configured"
-                else:
-                    lifecycle_rule_name = "Error"
-                    lifecycle_rule_status = "Error"
+            region = bucket.get("BucketRegion", "N/A")
+            versioning_status, logging_status, (lifecycle_rule_name, lifecycle_rule_status) = probe_results[bucket_name]
+            # Buckets have no bucket-wide storage class; this lists the bytes stored in each.
+            storage_class, size_bytes, object_count = footprints.get(bucket_name, NO_FOOTPRINT)
 
             # Write the bucket's details to the CSV file
             writer.writerow([bucket_name, storage_class, versioning_status, logging_status, 
-                             lifecycle_rule_name, lifecycle_rule_status])
+                             lifecycle_rule_name, lifecycle_rule_status, region, size_bytes, object_count])
 
             # Accumulate bucket names for summary based on logging status
             if logging_status == "Enabled":
@@ -108,17 +347,105 @@ def audit_s3_buckets(profile_name):
         writer.writerow(["Buckets with Lifecycle Setup Enabled", "Buckets with Lifecycle Setup Disabled"])
         writer.writerow([", ".join(lifecycle_enabled_buckets), ", ".join(lifecycle_disabled_buckets)])
 
+    def bucket_records():
+        for bucket in buckets:
+            bucket_name = bucket.get("Name", "N/A")
+            versioning_status, logging_status, (lifecycle_rule_name, lifecycle_rule_status) = probe_results[bucket_name]
+            storage_class, size_bytes, object_count = footprints.get(bucket_name, NO_FOOTPRINT)
+            yield {"bucket_name": bucket_name, "storage_class": storage_class, "size_bytes": size_bytes,
+                   "object_count": object_count, "versioning": versioning_status, "logging": logging_status,
+                   "lifecycle_rule_name": lifecycle_rule_name, "lifecycle_rule_status": lifecycle_rule_status,
+                   "region": bucket.get("BucketRegion", "N/A")}
+
+    sink.write("s3_buckets", bucket_records(), SINK_COLUMNS, "bucket_name")
+    sink.close({"buckets": total_buckets,
+                "access_logging_enabled": len(access_logging_enabled_buckets),
+                "lifecycle_enabled": len(lifecycle_enabled_buckets)})
+
     print("S3 bucket audit completed. Output saved to s3_audit.csv")
+    print_region_timings(region_timings)
+
+def audit_s3_stream(listing, s3_client, probe_client, region_footprint, region_names, default_region, workers,
+                    sink, config_settings, load_config_settings, known_regions):
+    """
+    Streaming layout: probe each page of the bucket listing and write its rows,
+    in listing order, before fetching the next one. The footer's bucket lists become counts in
+    s3_audit.manifest.json, so no bucket names are kept.
+    """
+    streams = StreamOutput("s3_audit.manifest.json")
+    out = streams.open("buckets", "s3_audit.csv", CSV_HEADER)
+    summary = {"Total Buckets Audited": 0,
+               "Buckets Enabled for Access Logging": 0, "Buckets Disabled for Access Logging": 0,
+               "Buckets with Lifecycle Setup Enabled": 0, "Buckets with Lifecycle Setup Disabled": 0}
+    region_timings = {}
+
+    for page in listing:
+        buckets, bucket_groups = group_buckets(s3_client, page.get("Buckets", []), region_names,
+                                               default_region, workers, known_regions)
+        bucket_regions = {bucket.get("Name", "N/A"): bucket.get("BucketRegion", "N/A") for bucket in buckets}
+        load_config_settings(bucket_regions.values())
+        results, timings = fan_out(
+            list(bucket_groups),
+            lambda region: (list(bucket_results(probe_client(region), bucket_groups[region], workers,
+                                                config_settings)),
+                            region_footprint(region, bucket_groups[region])))
+        for region, seconds in timings.items():
+            region_timings[region] = region_timings.get(region, 0.0) + seconds
+
+        # Regions finish in any order; rows are written in the listing's order.
+        page_rows = {}
+        for region_rows, footprint in results.values():
+            for bucket_name, versioning_status, logging_status, lifecycle in region_rows:
+                page_rows[bucket_name] = (versioning_status, logging_status, lifecycle,
+                                          footprint.get(bucket_name, NO_FOOTPRINT))
+        records = []
+        for bucket_name, region in bucket_regions.items():
+            versioning_status, logging_status, lifecycle, footprint = page_rows[bucket_name]
+            lifecycle_rule_name, lifecycle_rule_status = lifecycle
+            storage_class, size_bytes, object_count = footprint
+            out.write([bucket_name, storage_class, versioning_status, logging_status,
+                       lifecycle_rule_name, lifecycle_rule_status, region, size_bytes, object_count])
+            summary["Total Buckets Audited"] += 1
+            summary["Buckets Enabled for Access Logging" if logging_status == "Enabled"
+                    else "Buckets Disabled for Access Logging"] += 1
+            summary["Buckets with Lifecycle Setup Enabled" if lifecycle_rule_status == "Enabled"
+                    else "Buckets with Lifecycle Setup Disabled"] += 1
+            records.append({"bucket_name": bucket_name, "storage_class": storage_class,
+                            "size_bytes": size_bytes, "object_count": object_count,
+                            "versioning": versioning_status,
+                            "logging": logging_status, "lifecycle_rule_name": lifecycle_rule_name,
+                            "lifecycle_rule_status": lifecycle_rule_status, "region": region})
+        sink.write("s3_buckets", records, SINK_COLUMNS, "bucket_name")
+
+    streams.close(summary)
+    sink.close({"buckets": summary["Total Buckets Audited"],
+                "access_logging_enabled": summary["Buckets Enabled for Access Logging"],
+                "lifecycle_enabled": summary["Buckets with Lifecycle Setup Enabled"]})
+
+    print("S3 bucket audit completed. Output saved to s3_audit.csv and s3_audit.manifest.json")
+    print_region_timings(region_timings)
 
 if __name__ == "__main__":
     # Accept the AWS profile as a command-line argument.
-    if len(sys.argv) != 2:
-        print("Usage: python3 s3audit.py <AWS_PROFILE>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Audit S3 bucket versioning, logging and lifecycle settings.")
+    parser.add_argument("profile", help="AWS profile to audit")
+    add_region_arguments(parser)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"concurrent bucket probes per region (default {DEFAULT_WORKERS})")
+    auditsink.add_sink_arguments(parser)
+    add_stream_arguments(parser)
+    configbackend.add_backend_arguments(parser)
+    parser.add_argument("--no-storage-metrics", dest="storage_metrics", action="store_false",
+                        help="leave the storage class, size and object count columns as N/A "
+                             "instead of reading CloudWatch storage metrics")
+    args = parser.parse_args()
 
-    PROFILE_NAME = sys.argv[1]
+    PROFILE_NAME = args.profile
     try:
-        audit_s3_buckets(PROFILE_NAME)
+        audit_s3_buckets(PROFILE_NAME, regions=args.regions, workers=max(args.workers, 1), sqlite_path=args.sqlite,
+                         stream=args.stream, backend=args.backend, config_aggregator=args.config_aggregator,
+                         storage_metrics=args.storage_metrics)
     except botocore.exceptions.NoCredentialsError:
         print("No credentials found. Please ensure your profile is set up correctly in .aws/config.")
+        sys.exit(1)
 
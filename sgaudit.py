@@ -1,21 +1,22 @@
-import boto3
+import argparse
 import botocore
 import csv
 import sys
+import threading
 
-def audit_security_groups(profile_name):
-    # Create a session using the specified AWS profile.
-    session = boto3.Session(profile_name=profile_name)
-    ec2_client = session.client('ec2')
+import auditsink
+import configbackend
+import invcache
+from regionfanout import add_region_arguments, fan_out, print_region_timings, regional_clients, resolve_regions
 
-    # Retrieve all security groups.
-    sg_response = ec2_client.describe_security_groups()
-    security_groups = sg_response['SecurityGroups']
+# Ingress sources that mean "open to the world".
+OPEN_CIDRS = {"IpRanges": ("CidrIp", "0.0.0.0/0"), "Ipv6Ranges": ("CidrIpv6", "::/0")}
+# EC2 accepts at most 200 values per filter.
+FILTER_VALUE_LIMIT = 200
 
-    # Retrieve all EC2 instances and build a mapping from security group ID to instance details.
-    instances_response = ec2_client.describe_instances()
-    sg_instance_map = {}  # key: security group id; value: list of tuples (instance_id, instance_name)
-    for reservation in instances_response.get('Reservations', []):
+def add_instances(page, sg_instance_map):
+    """Add every instance in a describe_instances page to the security group id -> instances map."""
+    for reservation in page.get('Reservations', []):
         for instance in reservation.get('Instances', []):
             instance_id = instance.get('InstanceId', 'N/A')
             instance_name = 'N/A'
@@ -30,42 +31,264 @@ def audit_security_groups(profile_name):
                         sg_instance_map[sg_id] = []
                     sg_instance_map[sg_id].append((instance_id, instance_name))
 
-    # Save the audit output to a CSV file.
-    with open('security_audit.csv', 'w', newline='') as f:
+def collect_open_groups(ec2_client, cache):
+    """
+    Like collect_region, but EC2 does the filtering: only groups with an ingress
+    rule from 0.0.0.0/0 or ::/0 are returned, and only instances in those groups.
+    """
+    # The two CIDR filters are separate calls; values of one filter are ORed,
+    # but ip-permission.cidr and ip-permission.ipv6-cidr together would be ANDed.
+    groups_by_id = {}
+    for filter_name, cidr in (('ip-permission.cidr', '0.0.0.0/0'), ('ip-permission.ipv6-cidr', '::/0')):
+        for page in cache.pages(ec2_client, 'describe_security_groups',
+                                Filters=[{'Name': filter_name, 'Values': [cidr]}]):
+            for sg in page['SecurityGroups']:
+                groups_by_id.setdefault(sg['GroupId'], sg)
+    security_groups = sorted(groups_by_id.values(), key=lambda sg: sg['GroupId'])
+
+    sg_instance_map = {}
+    group_ids = list(groups_by_id)
+    for i in range(0, len(group_ids), FILTER_VALUE_LIMIT):
+        chunk = group_ids[i:i + FILTER_VALUE_LIMIT]
+        for page in cache.pages(ec2_client, 'describe_instances',
+                                Filters=[{'Name': 'instance.group-id', 'Values': chunk}],
+                                PaginationConfig={'PageSize': 1000}):
+            add_instances(page, sg_instance_map)
+    # An instance in several open groups of different chunks is listed once per chunk.
+    for sg_id, instances in sg_instance_map.items():
+        sg_instance_map[sg_id] = list(dict.fromkeys(instances))
+    return security_groups, sg_instance_map
+
+def collect_region(ec2_client, cache):
+    """Return (security groups, security group id -> [(instance id, instance name)]) for one region."""
+    # Retrieve all security groups.
+    security_groups = []
+    for page in cache.pages(ec2_client, 'describe_security_groups'):
+        security_groups.extend(page['SecurityGroups'])
+
+    # Retrieve all EC2 instances and build a mapping from security group ID to instance details.
+    sg_instance_map = {}  # key: security group id; value: list of tuples (instance_id, instance_name)
+    for page in cache.pages(ec2_client, 'describe_instances', PaginationConfig={'PageSize': 1000}):
+        add_instances(page, sg_instance_map)
+    return security_groups, sg_instance_map
+
+# ----------------------- Output ---------------------------
+FLAT_HEADER = ["Security Group ID", "Security Group Name", "Instance ID", "Instance Name",
+               "Direction", "Protocol", "From Port", "To Port", "CIDR", "Description", "Region"]
+NORMALIZED_FILES = {
+    "rules": "sg_open_rules.csv",
+    "membership": "sg_membership.csv",
+    "exposure": "sg_instance_exposure.csv",
+}
+
+def open_rules(sg):
+    """Yield (protocol, from port, to port, cidr, description) for every inbound rule open to the world."""
+    for rule in sg.get("IpPermissions", []):
+        protocol = rule.get("IpProtocol", "N/A")
+        from_port = rule.get("FromPort", "N/A")
+        to_port = rule.get("ToPort", "N/A")
+        for ranges_key, (cidr_key, open_cidr) in OPEN_CIDRS.items():
+            for ip_range in rule.get(ranges_key, []):
+                cidr = ip_range.get(cidr_key, "")
+                if cidr == open_cidr:
+                    yield protocol, from_port, to_port, cidr, ip_range.get("Description", "")
+
+def port_label(protocol, from_port, to_port):
+    """tcp/22, tcp/8000-8080 or all."""
+    if protocol == "-1":
+        return "all"
+    if from_port == to_port:
+        return f"{protocol}/{from_port}"
+    return f"{protocol}/{from_port}-{to_port}"
+
+def write_flat(region_results, total_security_groups, path='security_audit.csv'):
+    """One row per open rule and attached instance: the classic security_audit.csv."""
+    with open(path, 'w', newline='') as f:
         writer = csv.writer(f)
         # Write a row with the total count of security groups.
-        writer.writerow([f"Total Security Groups: {len(security_groups)}"])
-        # Write the CSV header row.
-        writer.writerow(["Security Group ID", "Security Group Name", "Instance ID", "Instance Name",
-                         "Direction", "Protocol", "From Port", "To Port", "CIDR", "Description"])
-        
-        # Process only inbound (IpPermissions) rules.
+        writer.writerow([f"Total Security Groups: {total_security_groups}"])
+        writer.writerow(FLAT_HEADER)
+        for region, (security_groups, sg_instance_map) in region_results.items():
+            for sg in security_groups:
+                sg_id = sg.get("GroupId", "N/A")
+                sg_name = sg.get("GroupName", "N/A")
+                # Get associated instance details; if none, default to ("N/A", "N/A").
+                attached_instances = sg_instance_map.get(sg_id, [("N/A", "N/A")])
+                for protocol, from_port, to_port, cidr, description in open_rules(sg):
+                    for instance_id, instance_name in attached_instances:
+                        writer.writerow([sg_id, sg_name, instance_id, instance_name,
+                                         "Ingress", protocol, from_port, to_port, cidr, description, region])
+
+class NormalizedTables:
+    """
+    The three tables written instead of the rule x instance product: open
+    rules per group, group membership of open groups, and one exposure row
+    per instance. Each region's rows are written as soon as it and every
+    region listed before it have been collected, so the files keep the
+    order of the region list.
+    """
+
+    def __init__(self, region_names):
+        self._pending_regions = list(region_names)
+        self._collected = {}
+        self._lock = threading.Lock()
+        self._files = [open(NORMALIZED_FILES[name], 'w', newline='') for name in ("rules", "membership", "exposure")]
+        self.rules, self.membership, self.exposure = (csv.writer(f) for f in self._files)
+        self.rules.writerow(["Region", "Security Group ID", "Security Group Name",
+                             "Protocol", "From Port", "To Port", "CIDR", "Description"])
+        self.membership.writerow(["Region", "Security Group ID", "Instance ID", "Instance Name"])
+        self.exposure.writerow(["Region", "Instance ID", "Instance Name", "Open Security Groups",
+                                "Open Rule Count", "Exposed Ports", "Exposed CIDRs"])
+
+    def add_region(self, region, security_groups, sg_instance_map):
+        """Record a collected region and write every region that is now next in line."""
+        with self._lock:
+            self._collected[region] = (security_groups, sg_instance_map)
+            while self._pending_regions and self._pending_regions[0] in self._collected:
+                next_region = self._pending_regions.pop(0)
+                self._write_region(next_region, *self._collected.pop(next_region))
+                for f in self._files:
+                    f.flush()
+
+    def _write_region(self, region, security_groups, sg_instance_map):
+        # instance id -> [name, group ids, rule count, ports, cidrs], for this region only.
+        exposed = {}
         for sg in security_groups:
             sg_id = sg.get("GroupId", "N/A")
-            sg_name = sg.get("GroupName", "N/A")
-            # Get associated instance details; if none, default to ("N/A", "N/A").
-            attached_instances = sg_instance_map.get(sg_id, [("N/A", "N/A")])
-            for rule in sg.get("IpPermissions", []):
-                protocol = rule.get("IpProtocol", "N/A")
-                from_port = rule.get("FromPort", "N/A")
-                to_port = rule.get("ToPort", "N/A")
-                for ip_range in rule.get("IpRanges", []):
-                    cidr = ip_range.get("CidrIp", "")
-                    if cidr == "0.0.0.0/0":
-                        description = ip_range.get("Description", "")
-                        for instance_id, instance_name in attached_instances:
-                            writer.writerow([sg_id, sg_name, instance_id, instance_name,
-                                             "Ingress", protocol, from_port, to_port, cidr, description])
-    
-    print("Security audit completed. Output saved to security_audit.csv")
+            sg_rules = list(open_rules(sg))
+            if not sg_rules:
+                continue
+            for protocol, from_port, to_port, cidr, description in sg_rules:
+                self.rules.writerow([region, sg_id, sg.get("GroupName", "N/A"),
+                                     protocol, from_port, to_port, cidr, description])
+            for instance_id, instance_name in sg_instance_map.get(sg_id, []):
+                self.membership.writerow([region, sg_id, instance_id, instance_name])
+                entry = exposed.setdefault(instance_id, [instance_name, [], 0, {}, {}])
+                entry[1].append(sg_id)
+                entry[2] += len(sg_rules)
+                for protocol, from_port, to_port, cidr, _ in sg_rules:
+                    entry[3][port_label(protocol, from_port, to_port)] = None
+                    entry[4][cidr] = None
+        for instance_id, (instance_name, sg_ids, rule_count, ports, cidrs) in exposed.items():
+            self.exposure.writerow([region, instance_id, instance_name, ";".join(sg_ids),
+                                    rule_count, ";".join(ports), ";".join(cidrs)])
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+def write_flat_view(rules_path, membership_path, total_security_groups, path='security_audit.csv'):
+    """Derive the classic flat CSV from the open-rules and membership tables."""
+    members = {}
+    with open(membership_path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for region, sg_id, instance_id, instance_name in reader:
+            members.setdefault((region, sg_id), []).append((instance_id, instance_name))
+    with open(rules_path, newline='') as rules_file, open(path, 'w', newline='') as f:
+        reader = csv.reader(rules_file)
+        next(reader)
+        writer = csv.writer(f)
+        writer.writerow([f"Total Security Groups: {total_security_groups}"])
+        writer.writerow(FLAT_HEADER)
+        for region, sg_id, sg_name, protocol, from_port, to_port, cidr, description in reader:
+            for instance_id, instance_name in members.get((region, sg_id), [("N/A", "N/A")]):
+                writer.writerow([sg_id, sg_name, instance_id, instance_name,
+                                 "Ingress", protocol, from_port, to_port, cidr, description, region])
+
+def rule_records(region_results):
+    """Rows of the sg_open_rules record type for the audit sink."""
+    for region, (security_groups, _) in region_results.items():
+        for sg in security_groups:
+            for protocol, from_port, to_port, cidr, description in open_rules(sg):
+                yield {"group_id": sg.get("GroupId", "N/A"), "group_name": sg.get("GroupName", "N/A"),
+                       "protocol": protocol, "from_port": from_port, "to_port": to_port,
+                       "cidr": cidr, "description": description, "region": region}
+
+def membership_records(region_results):
+    """Rows of the sg_membership record type: instances of groups with at least one open rule."""
+    for region, (security_groups, sg_instance_map) in region_results.items():
+        for sg in security_groups:
+            sg_id = sg.get("GroupId", "N/A")
+            if any(open_rules(sg)):
+                for instance_id, instance_name in sg_instance_map.get(sg_id, []):
+                    yield {"group_id": sg_id, "instance_id": instance_id, "instance_name": instance_name,
+                           "region": region}
+
+# record type -> (row generator, indexed id column, columns) for the audit sink.
+SINK_RECORDS = {
+    "sg_open_rules": (rule_records, "group_id", ("group_id", "group_name", "protocol", "from_port", "to_port",
+                                                 "cidr", "description", "region")),
+    "sg_membership": (membership_records, "instance_id", ("group_id", "instance_id", "instance_name", "region")),
+}
+
+def audit_security_groups(profile_name, regions=None, cache_ttl=invcache.DEFAULT_TTL, refresh_cache=False,
+                          server_filter=False, layout="flat", sqlite_path=None,
+                          backend=configbackend.DEFAULT_BACKEND, config_aggregator=None):
+    sink = auditsink.open_sink(profile_name, "sgaudit", sqlite_path)
+    # Clients come from the shared factory for the specified AWS profile.
+    region_names = resolve_regions(profile_name, regions)
+    ec2_clients = regional_clients(profile_name, 'ec2', region_names)
+    # Collectors read through the inventory cache, optionally behind AWS Config.
+    caches = {region: configbackend.open_backend(profile_name, region,
+                                                 invcache.open_cache(profile_name, region, cache_ttl, refresh_cache),
+                                                 backend, config_aggregator)
+              for region in region_names}
+
+    collect = collect_open_groups if server_filter else collect_region
+    tables = NormalizedTables(region_names) if layout in ("normalized", "both") else None
+
+    def collect_and_write(region):
+        result = collect(ec2_clients[region], caches[region])
+        if tables:
+            tables.add_region(region, *result)
+        return result
+
+    try:
+        region_results, region_timings = fan_out(region_names, collect_and_write)
+    finally:
+        if tables:
+            tables.close()
+    total_security_groups = sum(len(security_groups) for security_groups, _ in region_results.values())
+
+    if tables:
+        print(f"Security audit completed. Output saved to {', '.join(NORMALIZED_FILES.values())}")
+    if layout == "both":
+        write_flat_view(NORMALIZED_FILES["rules"], NORMALIZED_FILES["membership"], total_security_groups)
+    elif layout == "flat":
+        write_flat(region_results, total_security_groups)
+    if layout != "normalized":
+        print("Security audit completed. Output saved to security_audit.csv")
+
+    for record_type, (records, key, columns) in SINK_RECORDS.items():
+        sink.write(record_type, records(region_results), {column: column for column in columns}, key)
+    sink.close({"security_groups": total_security_groups})
+    for cache in caches.values():
+        cache.print_stats()
+    print_region_timings(region_timings)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 sgaudit.py <AWS_PROFILE>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Audit security groups for inbound rules open to the world.")
+    parser.add_argument("profile", help="AWS profile to audit")
+    add_region_arguments(parser)
+    invcache.add_cache_arguments(parser)
+    configbackend.add_backend_arguments(parser)
+    parser.add_argument("--server-filter", action="store_true",
+                        help="let EC2 filter for groups open to 0.0.0.0/0 or ::/0 and fetch only their instances; "
+                             "the total then counts open groups only")
+    parser.add_argument("--layout", choices=("flat", "normalized", "both"), default="flat",
+                        help="flat: security_audit.csv, one row per open rule and instance (default); "
+                             "normalized: open rules, group membership and per-instance exposure tables; "
+                             "both: the normalized tables plus security_audit.csv derived from them")
+    auditsink.add_sink_arguments(parser)
+    args = parser.parse_args()
 
-    PROFILE_NAME = sys.argv[1]  # Get the profile name from the command-line argument
+    PROFILE_NAME = args.profile  # Get the profile name from the command-line argument
     try:
-        audit_security_groups(PROFILE_NAME)
+        audit_security_groups(PROFILE_NAME, regions=args.regions, cache_ttl=args.cache_ttl, refresh_cache=args.refresh_cache,
+                              server_filter=args.server_filter, layout=args.layout,
+                              sqlite_path=args.sqlite, backend=args.backend,
+                              config_aggregator=args.config_aggregator)
     except botocore.exceptions.NoCredentialsError:
         print("No credentials found. Please ensure your profile is set up correctly in .aws/config.")
+        sys.exit(1)
@@ -0,0 +1,33 @@
+from pagecollect import iter_pages
+
+
+def backup_ami_snapshot_ids(ec2_client):
+    """
+    Single pass over the account's AMIs: return the set of snapshot IDs
+    referenced by the block device mappings of AMIs created by AWS Backup.
+    """
+    snapshot_ids = set()
+    for page in iter_pages(ec2_client, 'describe_images', Owners=['self'],
+                           PaginationConfig={'PageSize': 1000}):
+        for ami in page['Images']:
+            if 'awsbackup' not in ami.get('Name', '').lower():
+                continue
+            for block_device in ami.get('BlockDeviceMappings', []):
+                # Safely check if 'Ebs' exists in the block device
+                snapshot_id = block_device.get('Ebs', {}).get('SnapshotId')
+                if snapshot_id:
+                    snapshot_ids.add(snapshot_id)
+    return snapshot_ids
+
+
+def classify_snapshots(ec2_client):
+    """
+    Stream every snapshot owned by the account through the AWS Backup AMI
+    index, yielding (snapshot_id, is_attached) one page at a time.
+    """
+    attached_ids = backup_ami_snapshot_ids(ec2_client)
+    for page in iter_pages(ec2_client, 'describe_snapshots', OwnerIds=['self'],
+                           PaginationConfig={'PageSize': 1000}):
+        for snapshot in page['Snapshots']:
+            snapshot_id = snapshot['SnapshotId']
+            yield snapshot_id, snapshot_id in attached_ids
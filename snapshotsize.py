@@ -0,0 +1,151 @@
+"""
+Incremental snapshot sizes from the EBS direct APIs.
+
+EBS snapshots are incremental, so a snapshot's VolumeSize says nothing of
+what it costs. Each volume's snapshots are ordered by start time; the first
+is sized by counting its blocks (ListSnapshotBlocks) and every later one by
+the blocks changed since its predecessor (ListChangedBlocks). The pairs are
+counted on a bounded pool, and the count for a pair of snapshots never
+changes, so each is cached on disk for good.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import botocore
+
+from invcache import cache_root
+
+DEFAULT_WORKERS = 8
+# Blocks per List*Blocks page; the API allows up to 10000.
+BLOCKS_PAGE_SIZE = 10000
+# Copied snapshots report this placeholder instead of their source volume.
+UNKNOWN_VOLUME = "vol-ffffffff"
+
+
+class PairCache:
+    """Changed-block counts per (previous snapshot, snapshot) pair for one profile and region."""
+
+    def __init__(self, profile_name, region):
+        self.path = os.path.join(cache_root(), "ebs", profile_name, f"{region or 'default'}-changed-blocks.json")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._new = {}
+        self._pairs = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(previous_id, snapshot_id):
+        return f"{previous_id or ''}:{snapshot_id}"
+
+    def get(self, previous_id, snapshot_id):
+        """Cached (changed blocks, block size) for a pair, or None."""
+        with self._lock:
+            counted = self._pairs.get(self.key(previous_id, snapshot_id))
+            if counted is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return tuple(counted)
+
+    def put(self, previous_id, snapshot_id, counted):
+        with self._lock:
+            self._new[self.key(previous_id, snapshot_id)] = list(counted)
+
+    def save(self):
+        """Write new pairs, merged with whatever other runs saved since this one started."""
+        with self._lock:
+            if not self._new:
+                return
+            pairs = self._load()
+            pairs.update(self._new)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(pairs, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._pairs = pairs
+            self._new = {}
+
+    def print_stats(self):
+        print(f"Snapshot block cache ({os.path.basename(self.path)}): {self.hits} hits, {self.misses} misses")
+
+
+def lineage_pairs(snapshots):
+    """
+    Yield (previous snapshot id or None, snapshot id) for every snapshot,
+    pairing each with the one taken before it from the same volume.
+    Copied snapshots have no known volume and are sized in full.
+    """
+    by_volume = {}
+    for snap in snapshots:
+        if snap["VolumeID"] in (UNKNOWN_VOLUME, "N/A"):
+            yield None, snap["SnapshotID"]
+        else:
+            by_volume.setdefault(snap["VolumeID"], []).append(snap)
+    for lineage in by_volume.values():
+        lineage.sort(key=lambda snap: snap["StartTime"])
+        previous_id = None
+        for snap in lineage:
+            yield previous_id, snap["SnapshotID"]
+            previous_id = snap["SnapshotID"]
+
+
+def count_blocks(ebs_client, previous_id, snapshot_id):
+    """
+    (blocks written by the snapshot, block size in bytes): every block when it
+    has no predecessor, otherwise the blocks changed since previous_id.
+    """
+    blocks = 0
+    block_size = 0
+    kwargs = {"MaxResults": BLOCKS_PAGE_SIZE}
+    while True:
+        if previous_id is None:
+            page = ebs_client.list_snapshot_blocks(SnapshotId=snapshot_id, **kwargs)
+            blocks += len(page.get("Blocks", []))
+        else:
+            page = ebs_client.list_changed_blocks(FirstSnapshotId=previous_id, SecondSnapshotId=snapshot_id,
+                                                  **kwargs)
+            # Blocks only in the older snapshot were dropped, not written.
+            blocks += sum(1 for block in page.get("ChangedBlocks", []) if "SecondBlockToken" in block)
+        block_size = page.get("BlockSize", block_size)
+        if not page.get("NextToken"):
+            return blocks, block_size
+        kwargs["NextToken"] = page["NextToken"]
+
+
+def incremental_sizes(ebs_client, snapshots, pair_cache, workers=DEFAULT_WORKERS):
+    """
+    {snapshot id: bytes the snapshot added to its lineage}, or "Error" where
+    the EBS direct API refused (e.g. a snapshot still pending).
+    """
+    def size(pair):
+        previous_id, snapshot_id = pair
+        counted = pair_cache.get(previous_id, snapshot_id)
+        if counted is None:
+            try:
+                counted = count_blocks(ebs_client, previous_id, snapshot_id)
+            except botocore.exceptions.ClientError:
+                return snapshot_id, "Error"
+            pair_cache.put(previous_id, snapshot_id, counted)
+        blocks, block_size = counted
+        return snapshot_id, blocks * block_size
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(size, lineage_pairs(snapshots)))
+
+
+def add_snapshot_size_arguments(parser):
+    parser.add_argument("--snapshot-sizes", action="store_true",
+                        help="estimate each snapshot's incremental size from the EBS direct APIs "
+                             "(one call per snapshot pair, cached)")
+    parser.add_argument("--snapshot-size-workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"concurrent EBS direct API calls per region (default {DEFAULT_WORKERS})")